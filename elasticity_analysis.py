@@ -1,149 +1,131 @@
 # /// script
 # requires-python = ">=3.9"
-# dependencies = []
+# dependencies = ["numpy", "numba"]
 # ///
 """Elasticity analysis for beach volleyball state machine statistics."""
 
-from typing import Dict, List, Tuple, Any
-from decimal import Decimal
-import copy
-from state_definitions import create_beach_volleyball_state_machine
-from match_simulator import simulate_match_points
+from typing import Dict, List, Mapping, Tuple, Any, Optional, NamedTuple, TextIO
+from functools import lru_cache
+from statistics import fmean
+from types import MappingProxyType
+import io
+import random
+import sys
+import numpy as np
+from state_definitions import create_beach_volleyball_state_machine, get_winning_team
+from types_ import StateTransitionTuple, ProbabilityTransitions
+from state_machine import RallyStateMachine
 from state_machine_builder import create_state_machine_from_teams
+from match_simulator import build_serving_state_machines
+from match_simulator_fast import simulate_match_points_csr
+from rally_simulator_fast import CSRStateMachine, encode_csr, patch_csr_row
 
 
-def extract_baseline_probabilities() -> Dict[str, float]:
-    """Extract baseline probabilities from the standard state machine."""
-    sm = create_beach_volleyball_state_machine()
-    baseline = {}
+# Trainable stats as (stat_name, from_state, next_state keyword): the stat is
+# the probability of the first transition out of from_state whose target
+# contains the keyword
+_STAT_RULES: Tuple[Tuple[str, str, str], ...] = (
+    ("serve_ace_rate", "s_serve_ready", "ace"),
+    ("serve_error_rate", "s_serve_ready", "error"),
+    ("serve_in_play_rate", "s_serve_ready", "in_play"),
+    ("reception_perfect_rate", "s_serve_in_play", "perfect"),
+    ("reception_good_rate", "s_serve_in_play", "good"),
+    ("reception_error_rate", "s_serve_in_play", "error"),
+    ("attack_kill_from_perfect_set", "r_set_perfect", "kill"),
+    ("attack_error_from_perfect_set", "r_set_perfect", "error"),
+    ("attack_defended_from_perfect_set", "r_set_perfect", "defended"),
+    ("attack_kill_from_good_set", "r_set_good", "kill"),
+    ("attack_error_from_good_set", "r_set_good", "error"),
+    ("dig_perfect_rate", "r_attack_defended", "perfect"),
+    ("dig_good_rate", "r_attack_defended", "good"),
+    ("dig_error_rate", "r_attack_defended", "error"),
+    ("block_kill_rate", "r_attack_blocked", "s_block_kill"),
+    ("block_error_rate", "r_attack_blocked", "s_block_error"),
+)
+
+def _build_stat_index(sm: RallyStateMachine) -> Dict[str, Tuple[str, int]]:
+    """Resolve every stat rule to the (state, transition index) it refers to.
     
-    # Extract key probabilities that trainers can influence
-    for state, transitions in sm.transitions.items():
-        for next_state, probability, action_type in transitions:
-            # Create meaningful stat names
-            if state == "s_serve_ready":
-                if "ace" in next_state:
-                    baseline["serve_ace_rate"] = float(probability)
-                elif "error" in next_state:
-                    baseline["serve_error_rate"] = float(probability)
-                elif "in_play" in next_state:
-                    baseline["serve_in_play_rate"] = float(probability)
-            
-            elif state == "s_serve_in_play":
-                if "perfect" in next_state:
-                    baseline["reception_perfect_rate"] = float(probability)
-                elif "good" in next_state:
-                    baseline["reception_good_rate"] = float(probability)
-                elif "error" in next_state:
-                    baseline["reception_error_rate"] = float(probability)
-            
-            elif state == "r_set_perfect" and "attack" in next_state:
-                if "kill" in next_state:
-                    baseline["attack_kill_from_perfect_set"] = float(probability)
-                elif "error" in next_state:
-                    baseline["attack_error_from_perfect_set"] = float(probability)
-                elif "defended" in next_state:
-                    baseline["attack_defended_from_perfect_set"] = float(probability)
-            
-            elif state == "r_set_good" and "attack" in next_state:
-                if "kill" in next_state:
-                    baseline["attack_kill_from_good_set"] = float(probability)
-                elif "error" in next_state:
-                    baseline["attack_error_from_good_set"] = float(probability)
-            
-            elif state == "r_attack_defended":
-                if "perfect" in next_state:
-                    baseline["dig_perfect_rate"] = float(probability)
-                elif "good" in next_state:
-                    baseline["dig_good_rate"] = float(probability)
-                elif "error" in next_state:
-                    baseline["dig_error_rate"] = float(probability)
-            
-            elif state == "r_attack_blocked":
-                if "s_block_kill" in next_state:
-                    baseline["block_kill_rate"] = float(probability)
-                elif "s_block_error" in next_state:
-                    baseline["block_error_rate"] = float(probability)
+    Raises ValueError if a rule matches no transition, so a renamed state
+    fails at import instead of silently dropping a stat.
+    """
+    index = {}
+    for stat_name, state, keyword in _STAT_RULES:
+        for i, (next_state, _, _) in enumerate(sm.transitions.get(state, [])):
+            if keyword in next_state:
+                index[stat_name] = (state, i)
+                break
+        else:
+            raise ValueError(f"No transition from {state} matches '{keyword}' for stat: {stat_name}")
+    return index
+
+
+# stat_name -> (state, transition index) in the standard state machine
+_STAT_INDEX: Dict[str, Tuple[str, int]] = _build_stat_index(create_beach_volleyball_state_machine())
+
+
+@lru_cache(maxsize=1)
+def extract_baseline_probabilities() -> Mapping[str, float]:
+    """Extract baseline probabilities from the standard state machine.
     
-    return baseline
+    The result is cached and read-only.
+    """
+    sm = create_beach_volleyball_state_machine()
+    return MappingProxyType({stat_name: sm.transitions[state][i][1]
+                             for stat_name, (state, i) in _STAT_INDEX.items()})
 
 
-def create_modified_state_machine(baseline_probs: Dict[str, float], stat_name: str, improvement_factor: float):
-    """Create a state machine with one stat improved."""
+def _improved_transitions(stat_name: str, improvement_factor: float) -> Tuple[str, List[StateTransitionTuple]]:
+    """Return (state, new transitions) for the standard machine with one stat improved."""
     sm = create_beach_volleyball_state_machine()
     
-    # Create a copy of transitions
-    modified_transitions = copy.deepcopy(sm.transitions)
+    if stat_name not in _STAT_INDEX:
+        raise ValueError(f"Could not find transition for stat: {stat_name}")
+    state, i = _STAT_INDEX[stat_name]
+    transitions = sm.transitions[state]
     
-    # Apply the improvement to the specific stat
-    improvement_applied = False
+    # Raise the target probability (capped at 1.0) and scale every other
+    # transition by the same factor so the row sums to exactly 1.0 in one pass
+    probs = [p for _, p, _ in transitions]
+    new_prob = min(probs[i] * improvement_factor, 1.0)
+    total_other_prob = sum(probs) - probs[i]
     
-    for state, transitions in modified_transitions.items():
-        for i, (next_state, probability, action_type) in enumerate(transitions):
-            should_modify = False
-            
-            # Map stat names to state transitions
-            if stat_name == "serve_ace_rate" and state == "s_serve_ready" and "ace" in next_state:
-                should_modify = True
-            elif stat_name == "serve_error_rate" and state == "s_serve_ready" and "error" in next_state:
-                should_modify = True
-            elif stat_name == "reception_perfect_rate" and state == "s_serve_in_play" and "perfect" in next_state:
-                should_modify = True
-            elif stat_name == "reception_good_rate" and state == "s_serve_in_play" and "good" in next_state:
-                should_modify = True
-            elif stat_name == "attack_kill_from_perfect_set" and state == "r_set_perfect" and "kill" in next_state:
-                should_modify = True
-            elif stat_name == "attack_kill_from_good_set" and state == "r_set_good" and "kill" in next_state:
-                should_modify = True
-            elif stat_name == "dig_perfect_rate" and state == "r_attack_defended" and "perfect" in next_state:
-                should_modify = True
-            elif stat_name == "block_kill_rate" and state == "r_attack_blocked" and "s_block_kill" in next_state:
-                should_modify = True
-            
-            if should_modify:
-                # Calculate the improvement
-                old_prob = float(probability)
-                improvement_amount = old_prob * (improvement_factor - 1.0)  # Absolute improvement
-                new_prob = old_prob + improvement_amount
-                
-                # Ensure new probability doesn't exceed 1.0
-                if new_prob > 1.0:
-                    new_prob = 1.0
-                    improvement_amount = new_prob - old_prob
-                
-                # Calculate how much to reduce from other probabilities
-                other_transitions = [(j, ns, p, at) for j, (ns, p, at) in enumerate(transitions) if j != i]
-                total_other_prob = sum(float(p) for _, _, p, _ in other_transitions)
-                
-                if total_other_prob > 0 and improvement_amount > 0:
-                    # Reduce other probabilities proportionally
-                    reduction_factor = improvement_amount / total_other_prob
-                    
-                    # Update all transitions for this state
-                    new_transitions = []
-                    for j, (ns, p, at) in enumerate(transitions):
-                        if j == i:
-                            new_transitions.append((ns, Decimal(str(new_prob)), at))
-                        else:
-                            reduced_prob = float(p) * (1.0 - reduction_factor)
-                            new_transitions.append((ns, Decimal(str(reduced_prob)), at))
-                    
-                    # Verify probabilities sum to 1.0
-                    total_check = sum(float(p) for _, p, _ in new_transitions)
-                    if abs(total_check - 1.0) > 0.001:
-                        # Renormalize if needed
-                        new_transitions = [(ns, Decimal(str(float(p) / total_check)), at) 
-                                         for ns, p, at in new_transitions]
-                    
-                    modified_transitions[state] = new_transitions
-                    improvement_applied = True
-                break
+    if total_other_prob <= 0 or new_prob <= probs[i]:
+        raise ValueError(f"Could not apply improvement for stat: {stat_name}")
     
-    if not improvement_applied:
-        raise ValueError(f"Could not find transition for stat: {stat_name}")
+    scale = (1.0 - new_prob) / total_other_prob
+    new_probs = [new_prob if j == i else p * scale for j, p in enumerate(probs)]
+    
+    # Fold any rounding residual into the modified transition only, instead
+    # of renormalizing the whole row
+    residual = 1.0 - sum(new_probs)
+    if abs(residual) > 1e-12:
+        new_probs[i] += residual
+    
+    return state, [(ns, p, at) for (ns, _, at), p in zip(transitions, new_probs)]
+
+
+def improved_row_probabilities(stat_name: str, improvement_factor: float) -> Tuple[str, List[float]]:
+    """Return (state, its new transition probabilities) with one stat improved.
+    
+    The probabilities are in the standard machine's transition order, ready
+    to patch into an encoded machine (see rally_simulator_fast.patch_csr_row).
+    """
+    state, new_transitions = _improved_transitions(stat_name, improvement_factor)
+    return state, [probability for _, probability, _ in new_transitions]
+
+
+def create_modified_state_machine(baseline_probs: Mapping[str, float], stat_name: str, improvement_factor: float):
+    """Create a state machine with one stat improved."""
+    sm = create_beach_volleyball_state_machine()
+    state, new_transitions = _improved_transitions(stat_name, improvement_factor)
+    
+    # Shallow copy: only the modified state's list is replaced, every other
+    # state keeps sharing its (immutable) transition tuples
+    modified_transitions = dict(sm.transitions)
+    modified_transitions[state] = new_transitions
     
     # Create new state machine with modified transitions
-    from state_machine import RallyStateMachine
     return RallyStateMachine(
         transitions=modified_transitions,
         terminal_states=sm.terminal_states,
@@ -151,6 +133,20 @@ def create_modified_state_machine(baseline_probs: Dict[str, float], stat_name: s
     )
 
 
+def create_modified_template(baseline_template: ProbabilityTransitions, stat_name: str,
+                             improvement_factor: float) -> ProbabilityTransitions:
+    """Template equal to convert_state_machine_to_template(create_modified_state_machine(...)).
+    
+    Copies baseline_template (the standard machine's template) shallowly and
+    replaces only the improved state's row, skipping the machine build and
+    full conversion.
+    """
+    state, new_transitions = _improved_transitions(stat_name, improvement_factor)
+    template = dict(baseline_template)
+    template[state] = [(next_state, probability) for next_state, probability, _ in new_transitions]
+    return template
+
+
 def convert_state_machine_to_template(sm):
     """Convert state machine to template format for simulate_match_points."""
     template = {}
@@ -160,47 +156,173 @@ def convert_state_machine_to_template(sm):
     return template
 
 
-def calculate_elasticity(stat_name: str, baseline_probs: Dict[str, float], 
-                        improvement_pct: float = 0.05, num_points: int = 10000) -> float:
-    """Calculate elasticity for a specific stat."""
+def _transition_row(sm: RallyStateMachine, state: str, state_idx: Dict[str, int]) -> np.ndarray:
+    """Dense transition row of `state` in `sm`, indexed by `state_idx`."""
+    row = np.zeros(len(state_idx))
+    for next_state, probability, _ in sm.transitions.get(state, []):
+        row[state_idx[next_state]] += probability
+    return row
+
+
+def _transition_matrix(serving_sm: RallyStateMachine, receiving_sm: RallyStateMachine,
+                       state_idx: Dict[str, int]) -> np.ndarray:
+    """Build the full transition matrix for one point.
+    
+    Serving ('s_') states follow the serving team's probabilities and all
+    other states follow the receiving team's, as in simulate_match_points.
+    """
+    matrix = np.zeros((len(state_idx), len(state_idx)))
+    for state, i in state_idx.items():
+        source = serving_sm if state.startswith('s_') else receiving_sm
+        matrix[i] = _transition_row(source, state, state_idx)
+    return matrix
+
+
+class _AbsorbingLayout(NamedTuple):
+    """State ordering and terminal masks shared by every transition matrix."""
+    state_idx: Dict[str, int]
+    is_terminal: np.ndarray
+    serving_wins: np.ndarray
+    initial_row: int
+
+
+def _absorbing_layout(sm: RallyStateMachine) -> _AbsorbingLayout:
+    states = sm.sorted_states
+    is_terminal = np.array([sm.is_terminal_state(state) for state in states])
+    serving_wins = np.array([terminal and get_winning_team(state) == "serving"
+                             for state, terminal in zip(states, is_terminal)])
+    # Row of the initial state within the continuation block
+    continuation = [state for state, terminal in zip(states, is_terminal) if not terminal]
+    return _AbsorbingLayout(sm.state_to_idx, is_terminal,
+                            serving_wins, continuation.index(sm.initial_state))
+
+
+def _serving_win_probability(matrices: np.ndarray, layout: _AbsorbingLayout) -> np.ndarray:
+    """Probability that the serving team wins the point, by absorbing-chain algebra.
+    
+    With Q the continuation-to-continuation block and R the
+    continuation-to-terminal block, (I - Q)^-1 R holds the probability of
+    ending in each terminal state from each continuation state. `matrices`
+    may carry leading batch dimensions; all of them go through a single
+    batched np.linalg.solve call.
+    """
+    continuation = ~layout.is_terminal
+    q = matrices[..., continuation, :][..., continuation]
+    r = matrices[..., continuation, :][..., layout.is_terminal]
+    absorption = np.linalg.solve(np.eye(q.shape[-1]) - q, r)
+    
+    return absorption[..., layout.initial_row, layout.serving_wins[layout.is_terminal]].sum(axis=-1)
+
+
+def exact_win_rate(team_a_sm: RallyStateMachine, team_b_sm: RallyStateMachine) -> float:
+    """Exact long-run win percentage of team A with alternating serves.
     
-    print(f"Analyzing {stat_name}...")
+    This is the value simulate_match_points converges to as num_points grows,
+    computed with linear solves instead of Monte Carlo.
     
-    # Create baseline state machine
+    Example:
+        >>> sm = create_beach_volleyball_state_machine()
+        >>> exact_win_rate(sm, sm)
+        0.5
+    """
+    layout = _absorbing_layout(team_a_sm)
+    matrices = np.stack([_transition_matrix(team_a_sm, team_b_sm, layout.state_idx),
+                         _transition_matrix(team_b_sm, team_a_sm, layout.state_idx)])
+    a_serving_wins, b_serving_wins = _serving_win_probability(matrices, layout)
+    
+    # Team A serves half of the points and receives the other half
+    return float(0.5 * a_serving_wins + 0.5 * (1.0 - b_serving_wins))
+
+
+def calculate_elasticities(stat_names: List[str], baseline_probs: Mapping[str, float],
+                           improvement_pct: float = 0.05,
+                           out: Optional[TextIO] = None) -> Dict[str, float]:
+    """Calculate exact elasticities for several stats with one batched solve.
+    
+    Each improved team differs from the baseline in a single transition row,
+    so every stat gets a copy of the baseline matrices with that row
+    overwritten: slot 0 has the improved team serving, slot 1 receiving.
+    Progress messages go to `out` (stdout by default).
+    """
     baseline_sm = create_beach_volleyball_state_machine()
-    baseline_template = convert_state_machine_to_template(baseline_sm)
+    layout = _absorbing_layout(baseline_sm)
     
-    # Simulate baseline win rate
-    baseline_win_rate = simulate_match_points(baseline_template, baseline_template, num_points)
+    baseline_matrix = _transition_matrix(baseline_sm, baseline_sm, layout.state_idx)
+    matrices = np.broadcast_to(baseline_matrix,
+                               (len(stat_names), 2) + baseline_matrix.shape).copy()
     
-    # Create improved state machine
     improvement_factor = 1.0 + improvement_pct
-    try:
-        improved_sm = create_modified_state_machine(baseline_probs, stat_name, improvement_factor)
-        improved_template = convert_state_machine_to_template(improved_sm)
-        
-        # Simulate improved win rate (team with improvement vs baseline team)
-        improved_win_rate = simulate_match_points(improved_template, baseline_template, num_points)
+    for i, stat_name in enumerate(stat_names):
+        print(f"Analyzing {stat_name}...", file=out)
+        try:
+            improved_sm = create_modified_state_machine(baseline_probs, stat_name, improvement_factor)
+        except Exception as e:
+            # Leave the baseline rows in place: the elasticity comes out as 0.0
+            print(f"Error calculating elasticity for {stat_name}: {e}", file=out)
+            continue
         
-        # Calculate elasticity
-        win_rate_change = improved_win_rate - baseline_win_rate
-        elasticity = win_rate_change / (baseline_win_rate * improvement_pct)
-        
-        return elasticity
-        
-    except Exception as e:
-        print(f"Error calculating elasticity for {stat_name}: {e}")
-        return 0.0
+        state, _ = _STAT_INDEX[stat_name]
+        slot = 0 if state.startswith('s_') else 1
+        matrices[i, slot, layout.state_idx[state]] = _transition_row(improved_sm, state, layout.state_idx)
+    
+    serving_wins = _serving_win_probability(matrices, layout)
+    improved_win_rates = 0.5 * serving_wins[:, 0] + 0.5 * (1.0 - serving_wins[:, 1])
+    
+    # Self-play baseline is exactly 0.5
+    baseline_win_rate = 0.5
+    elasticities = (improved_win_rates - baseline_win_rate) / (baseline_win_rate * improvement_pct)
+    return dict(zip(stat_names, elasticities.tolist()))
 
 
-def run_elasticity_analysis(improvement_pct: float = 0.05, num_points: int = 10000) -> List[Tuple[str, float, float]]:
-    """Run complete elasticity analysis for all key stats."""
+def simulate_elasticity(stat_name: str, baseline_csr: CSRStateMachine,
+                        state_to_idx: Mapping[str, int], baseline_win_rate: float,
+                        improvement_pct: float = 0.05, num_points: int = 10000,
+                        seed: Optional[int] = None) -> float:
+    """Monte Carlo estimate of a stat's elasticity, used to validate the exact one.
     
-    print("Beach Volleyball Elasticity Analysis")
-    print("=" * 50)
-    print(f"Improvement: {improvement_pct*100:.1f}% per stat")
-    print(f"Simulation points: {num_points:,}")
-    print()
+    `baseline_win_rate` must have been simulated with the same `seed`: the
+    improved run then reuses the baseline's random draws and only the
+    modified transition changes outcomes (common random numbers).
+    """
+    state, probs = improved_row_probabilities(stat_name, 1.0 + improvement_pct)
+    improved_csr = patch_csr_row(baseline_csr, state_to_idx[state], probs)
+    
+    # The improved team is team A; its serving rows only apply while it serves
+    if state.startswith('s_'):
+        a_csr, b_csr = improved_csr, baseline_csr
+    else:
+        a_csr, b_csr = baseline_csr, improved_csr
+    improved_win_rate = simulate_match_points_csr(a_csr, b_csr, num_points, seed=seed)
+    
+    win_rate_change = improved_win_rate - baseline_win_rate
+    return win_rate_change / (baseline_win_rate * improvement_pct)
+
+
+def compute_baseline(num_points: int,
+                     seed: Optional[int] = None) -> Tuple[CSRStateMachine, Dict[str, int], float]:
+    """Encode the baseline matchup and simulate its (self-play) win rate."""
+    template = convert_state_machine_to_template(create_beach_volleyball_state_machine())
+    serves, _ = build_serving_state_machines(template, template)
+    baseline_csr = encode_csr(serves)
+    baseline_win_rate = simulate_match_points_csr(baseline_csr, baseline_csr, num_points, seed=seed)
+    return baseline_csr, serves.state_to_idx, baseline_win_rate
+
+
+def run_elasticity_analysis(improvement_pct: float = 0.05) -> List[Tuple[str, float, float]]:
+    """Run complete elasticity analysis for all key stats.
+    
+    Win rates come from an exact batched solve, so the results carry no
+    sampling noise.
+    
+    The report is built in memory and written to stdout in one go.
+    """
+    
+    report = io.StringIO()
+    print("Beach Volleyball Elasticity Analysis", file=report)
+    print("=" * 50, file=report)
+    print(f"Improvement: {improvement_pct*100:.1f}% per stat", file=report)
+    print("Win rates: exact (absorbing Markov chain solve)", file=report)
+    print(file=report)
     
     # Get baseline probabilities
     baseline_probs = extract_baseline_probabilities()
@@ -216,123 +338,128 @@ def run_elasticity_analysis(improvement_pct: float = 0.05, num_points: int = 100
         "block_kill_rate"
     ]
     
+    valid_stats = [stat for stat in stats_to_analyze if stat in baseline_probs]
+    for stat_name in stats_to_analyze:
+        if stat_name not in baseline_probs:
+            print(f"Warning: {stat_name} not found in baseline probabilities", file=report)
+    
+    elasticities = calculate_elasticities(valid_stats, baseline_probs, improvement_pct, report)
+    
     results = []
     
-    for stat_name in stats_to_analyze:
-        if stat_name in baseline_probs:
-            baseline_value = baseline_probs[stat_name]
-            elasticity = calculate_elasticity(stat_name, baseline_probs, improvement_pct, num_points)
-            
-            results.append((stat_name, elasticity, baseline_value))
-            
-            print(f"{stat_name:30} | Baseline: {baseline_value:6.1%} | Elasticity: {elasticity:+6.3f}")
-        else:
-            print(f"Warning: {stat_name} not found in baseline probabilities")
+    for stat_name in valid_stats:
+        baseline_value = baseline_probs[stat_name]
+        elasticity = elasticities[stat_name]
+        
+        results.append((stat_name, elasticity, baseline_value))
+        
+        print(f"{stat_name:30} | Baseline: {baseline_value:6.1%} | Elasticity: {elasticity:+6.3f}", file=report)
     
     # Sort by elasticity (highest impact first)
     results.sort(key=lambda x: abs(x[1]), reverse=True)
     
-    print("\n" + "=" * 50)
-    print("TRAINING PRIORITY RANKING")
-    print("=" * 50)
+    print("\n" + "=" * 50, file=report)
+    print("TRAINING PRIORITY RANKING", file=report)
+    print("=" * 50, file=report)
     
     for i, (stat_name, elasticity, baseline) in enumerate(results, 1):
         impact_desc = "High Impact" if abs(elasticity) > 1.0 else "Medium Impact" if abs(elasticity) > 0.5 else "Low Impact"
-        print(f"{i}. {stat_name:25} | {elasticity:+6.3f} | {impact_desc}")
+        print(f"{i}. {stat_name:25} | {elasticity:+6.3f} | {impact_desc}", file=report)
     
-    print(f"\nInterpretation: Elasticity shows how much win rate changes per 1% stat improvement")
-    print(f"Example: Elasticity of +2.0 means 1% stat improvement → +2% win rate improvement")
+    print(f"\nInterpretation: Elasticity shows how much win rate changes per 1% stat improvement", file=report)
+    print(f"Example: Elasticity of +2.0 means 1% stat improvement → +2% win rate improvement", file=report)
     
     # Training insights
-    print("\n" + "=" * 50)
-    print("TRAINING INSIGHTS FOR COACHES")
-    print("=" * 50)
+    print("\n" + "=" * 50, file=report)
+    print("TRAINING INSIGHTS FOR COACHES", file=report)
+    print("=" * 50, file=report)
     
     positive_impacts = [(name, elast, base) for name, elast, base in results if elast > 0]
     negative_impacts = [(name, elast, base) for name, elast, base in results if elast < 0]
     
     if positive_impacts:
-        print("🟢 SKILLS TO IMPROVE (Positive Impact):")
+        print("🟢 SKILLS TO IMPROVE (Positive Impact):", file=report)
         for name, elasticity, baseline in positive_impacts:
             readable_name = name.replace("_", " ").title()
-            print(f"   {readable_name}: {elasticity:+.3f} elasticity")
+            print(f"   {readable_name}: {elasticity:+.3f} elasticity", file=report)
             
             # Calculate practical examples
             example_improvement = baseline * 0.10  # 10% relative improvement
             win_rate_change = elasticity * 0.10 * 50  # Assuming 50% baseline win rate
-            print(f"   → Improving from {baseline:.1%} to {baseline + example_improvement:.1%} = {win_rate_change:+.1f}% win rate change")
-            print()
+            print(f"   → Improving from {baseline:.1%} to {baseline + example_improvement:.1%} = {win_rate_change:+.1f}% win rate change", file=report)
+            print(file=report)
     
     if negative_impacts:
-        print("🔴 UNEXPECTED NEGATIVE IMPACTS:")
+        print("🔴 UNEXPECTED NEGATIVE IMPACTS:", file=report)
         for name, elasticity, baseline in negative_impacts:
             readable_name = name.replace("_", " ").title()
-            print(f"   {readable_name}: {elasticity:+.3f} elasticity")
-            print(f"   → This suggests improving this stat alone may hurt win rate")
-            print(f"   → Likely due to opportunity cost or system interactions")
-            print()
+            print(f"   {readable_name}: {elasticity:+.3f} elasticity", file=report)
+            print(f"   → This suggests improving this stat alone may hurt win rate", file=report)
+            print(f"   → Likely due to opportunity cost or system interactions", file=report)
+            print(file=report)
     
     # Top recommendation
     if results:
         top_stat = results[0]
-        print("🎯 TOP TRAINING PRIORITY:")
+        print("🎯 TOP TRAINING PRIORITY:", file=report)
         readable_name = top_stat[0].replace("_", " ").title()
-        print(f"   Focus on: {readable_name}")
-        print(f"   Impact: {abs(top_stat[1]):.3f} elasticity")
+        print(f"   Focus on: {readable_name}", file=report)
+        print(f"   Impact: {abs(top_stat[1]):.3f} elasticity", file=report)
         if top_stat[1] > 0:
-            print(f"   Strategy: Increase this skill for direct win rate improvement")
+            print(f"   Strategy: Increase this skill for direct win rate improvement", file=report)
         else:
-            print(f"   Strategy: This has highest impact but negative - investigate why")
+            print(f"   Strategy: This has highest impact but negative - investigate why", file=report)
     
+    sys.stdout.write(report.getvalue())
     return results
 
 
 def test_consistency(num_trials=3, num_points=50000):
-    """Test consistency of elasticity results across multiple trials."""
+    """Check Monte Carlo elasticity estimates against the exact values.
+    
+    Each trial simulates every stat with a fresh seed; the trial values should
+    scatter tightly around the exact elasticity.
+    """
     print("TESTING RESULT CONSISTENCY")
     print("=" * 50)
-    print(f"Running {num_trials} trials with {num_points:,} points each")
+    print(f"Running {num_trials} simulated trials with {num_points:,} points each")
+    print()
+    
+    exact_results = run_elasticity_analysis(improvement_pct=0.05)
     print()
     
-    all_results = []
+    trial_baselines = []
     for trial in range(num_trials):
-        print(f"Trial {trial + 1}:")
-        results = run_elasticity_analysis(improvement_pct=0.05, num_points=num_points)
-        all_results.append(results)
-        print()
+        seed = random.randrange(2**32)
+        trial_baselines.append((seed,) + compute_baseline(num_points, seed))
     
     # Analyze consistency
     print("CONSISTENCY ANALYSIS")
     print("=" * 30)
     
-    if len(all_results) > 1:
-        # Get all stat names
-        stat_names = [stat for stat, _, _ in all_results[0]]
+    for stat_name, exact_elast, _ in exact_results:
+        elasticities = [
+            simulate_elasticity(stat_name, baseline_csr, state_to_idx, baseline_win_rate,
+                                0.05, num_points, seed)
+            for seed, baseline_csr, state_to_idx, baseline_win_rate in trial_baselines
+        ]
         
-        for stat_name in stat_names:
-            elasticities = []
-            for trial_results in all_results:
-                for name, elast, _ in trial_results:
-                    if name == stat_name:
-                        elasticities.append(elast)
-                        break
-            
-            if elasticities:
-                mean_elast = sum(elasticities) / len(elasticities)
-                min_elast = min(elasticities)
-                max_elast = max(elasticities)
-                range_elast = max_elast - min_elast
-                
-                print(f"{stat_name:25} | Mean: {mean_elast:+.3f} | Range: {range_elast:.3f} | Values: {elasticities}")
+        mean_elast = fmean(elasticities)
+        min_elast = min(elasticities)
+        max_elast = max(elasticities)
+        range_elast = max_elast - min_elast
+        
+        print(f"{stat_name:25} | Exact: {exact_elast:+.3f} | Mean: {mean_elast:+.3f} | "
+              f"Range: {range_elast:.3f} | Values: {elasticities}")
 
 
 if __name__ == "__main__":
-    # Single run with high confidence
-    print("SINGLE HIGH-CONFIDENCE RUN")
+    # Single exact run
+    print("SINGLE EXACT RUN")
     print("=" * 50)
-    results = run_elasticity_analysis(improvement_pct=0.05, num_points=100000)  # Very high for stable results
+    results = run_elasticity_analysis(improvement_pct=0.05)
     
     print("\n\n")
     
-    # Consistency test with multiple smaller runs
-    test_consistency(num_trials=3, num_points=30000)
\ No newline at end of file
+    # Validate the exact results against Monte Carlo runs
+    test_consistency(num_trials=3, num_points=5000)
\ No newline at end of file
@@ -1,6 +1,6 @@
 # /// script
 # requires-python = ">=3.9"
-# dependencies = ["numpy"]
+# dependencies = ["numpy", "numba"]
 # ///
 """Test feasibility of GPU acceleration for beach volleyball simulation."""
 
@@ -8,6 +8,43 @@ import numpy as np
 import time
 from state_definitions import create_beach_volleyball_state_machine
 
+try:
+    import numba as nb
+except ImportError:
+    nb = None
+
+# Array backend for the device sampler: CuPy runs on the GPU, NumPy is the
+# drop-in CPU fallback (the sampler only uses the API both share)
+try:
+    import cupy as xp
+except ImportError:
+    xp = np
+
+try:
+    import jax
+    import jax.numpy as jnp
+except ImportError:
+    jax = None
+
+
+if nb is not None:
+    @nb.njit('void(uint16[:, ::1], boolean[::1], int32[::1], int32[::1], uint16[::1])',
+             parallel=True, fastmath=True, cache=True)
+    def step_batch(cdf, is_terminal, current_states, rally_lengths, u):
+        """Advance every live rally by one transition, in place.
+        
+        Each rally binary-searches only its own CDF row with its uniform
+        draw, so no batch x states temporary is ever materialized. The CDF and
+        the draws are 16-bit fixed point (see _quantize_cdf).
+        """
+        for i in nb.prange(current_states.shape[0]):
+            state = current_states[i]
+            if is_terminal[state]:
+                continue
+            
+            current_states[i] = np.searchsorted(cdf[state], u[i])
+            rally_lengths[i] += 1
+
 def test_gpu_feasibility():
     """Test if we can vectorize the simulation for GPU acceleration."""
     
@@ -21,21 +58,22 @@ def test_gpu_feasibility():
     print(f"Continuation states: {len(sm.get_continuation_states())}")
     print(f"Terminal states: {len(sm.terminal_states)}")
     
-    # Create state-to-index mapping
-    all_states = sorted(sm.get_all_states())
-    state_to_idx = {state: i for i, state in enumerate(all_states)}
+    # State-to-index mapping is precomputed by the state machine
+    all_states = sm.sorted_states
+    state_to_idx = sm.state_to_idx
     
     print(f"\nState mapping created: {len(state_to_idx)} states")
     
     # Create transition probability matrix
     num_states = len(all_states)
-    transition_matrix = np.zeros((num_states, num_states))
+    # Probabilities carry ~3 decimals, so float32 is ample and halves the table
+    transition_matrix = np.zeros((num_states, num_states), dtype=np.float32)
     
     for state, transitions in sm.transitions.items():
         from_idx = state_to_idx[state]
         for next_state, probability, _ in transitions:
             to_idx = state_to_idx[next_state]
-            transition_matrix[from_idx, to_idx] = float(probability)
+            transition_matrix[from_idx, to_idx] = probability
     
     print(f"Transition matrix shape: {transition_matrix.shape}")
     print(f"Non-zero transitions: {np.count_nonzero(transition_matrix)}")
@@ -47,40 +85,51 @@ def test_gpu_feasibility():
     batch_size = 10000
     max_steps = 50
     
+    # Cumulative probabilities per row: sampling a row is then a single
+    # uniform draw compared against the row's CDF
+    cdf, is_terminal = _transition_cdf(transition_matrix)
+    cdf = _quantize_cdf(cdf)
+    
     # Start all rallies at initial state
     initial_state_idx = state_to_idx[sm.initial_state]
     current_states = np.full(batch_size, initial_state_idx, dtype=np.int32)
-    
-    # Track which rallies are still active
-    active_rallies = np.ones(batch_size, dtype=bool)
     rally_lengths = np.zeros(batch_size, dtype=np.int32)
     
+    if nb is not None:
+        print("Using Numba kernel for the step loop")
+        # Load (or compile) the kernel outside the timed region
+        step_batch(cdf, is_terminal, current_states[:0], rally_lengths[:0], np.empty(0, dtype=np.uint16))
+    else:
+        print("Numba not available - using NumPy step loop (pip install numba)")
+    
+    # Row-wise binary search without Numba: offset row s by s * 65536 so the
+    # flattened CDF is globally sorted and one np.searchsorted serves every row
+    row_offsets = np.arange(num_states, dtype=np.int64) * 65536
+    flat_cdf = (cdf.astype(np.int64) + row_offsets[:, None]).ravel()
+    
     start_time = time.time()
     
     for step in range(max_steps):
+        # Rallies sitting in a terminal state are finished
+        active_rallies = ~is_terminal[current_states]
         if not np.any(active_rallies):
             break
-            
-        # Get transition probabilities for current states
-        active_indices = np.where(active_rallies)[0]
         
-        for i in active_indices:
-            current_state = current_states[i]
-            state_name = all_states[current_state]
-            
-            # Check if terminal
-            if sm.is_terminal_state(state_name):
-                active_rallies[i] = False
-                continue
-            
-            # Get probabilities for this state
-            probs = transition_matrix[current_state]
-            
-            if np.sum(probs) > 0:
-                # Sample next state
-                next_state_idx = np.random.choice(num_states, p=probs/np.sum(probs))
-                current_states[i] = next_state_idx
-                rally_lengths[i] += 1
+        u = np.random.randint(1, 65536, size=batch_size, dtype=np.uint16)
+        
+        if nb is not None:
+            step_batch(cdf, is_terminal, current_states, rally_lengths, u)
+            continue
+        
+        # Sample the next state of every rally at once: the index of the
+        # first CDF entry at or above the draw is the chosen transition
+        positions = np.searchsorted(flat_cdf, row_offsets[current_states] + u)
+        next_states = positions - current_states.astype(np.int64) * num_states
+        
+        current_states = np.where(active_rallies, next_states, current_states).astype(np.int32)
+        rally_lengths += active_rallies
+    
+    active_rallies = ~is_terminal[current_states]
     
     elapsed_time = time.time() - start_time
     
@@ -125,8 +174,108 @@ def test_gpu_feasibility():
     return transition_matrix, state_to_idx, all_states
 
 
-def create_optimized_gpu_simulation():
-    """Outline for a full GPU-optimized implementation."""
+def _transition_cdf(transition_matrix):
+    """Build the per-row CDF and terminal mask (rows without transitions)."""
+    is_terminal = transition_matrix.sum(axis=1) == 0
+    cdf = np.cumsum(transition_matrix, axis=1)
+    # Pin the last column of every live row to exactly 1.0 so rounding in the
+    # cumulative sum can never push a draw past the final transition
+    cdf[~is_terminal, -1] = 1.0
+    return cdf, is_terminal
+
+
+def _quantize_cdf(cdf):
+    """Convert a CDF to 16-bit fixed point (1.0 -> 65535).
+    
+    Paired with integer draws in [1, 65535], "first entry >= draw" selects each
+    transition with probability (cdf[j] - cdf[j-1]) / 65535, and zero-width
+    entries are never selected.
+    """
+    return np.clip(np.round(cdf * 65535), 0, 65535).astype(np.uint16)
+
+
+def simulate_rallies_xp(transition_matrix, initial_state_idx, batch_size, max_steps=50):
+    """Run the vectorized rally sampler on the `xp` backend (CuPy when available).
+    
+    The CDF, the state vector and the random draws all live on the device;
+    only the final rally lengths are copied back to the host.
+    
+    Example:
+        >>> lengths = simulate_rallies_xp(transition_matrix, 0, 100000)
+        >>> lengths.mean()  # average number of transitions per rally
+    """
+    cdf, is_terminal = _transition_cdf(transition_matrix)
+    cdf = xp.asarray(cdf, dtype=xp.float32)
+    is_terminal = xp.asarray(is_terminal)
+    
+    current_states = xp.full(batch_size, initial_state_idx, dtype=xp.int32)
+    rally_lengths = xp.zeros(batch_size, dtype=xp.int32)
+    
+    for _ in range(max_steps):
+        active_rallies = ~is_terminal[current_states]
+        if not bool(active_rallies.any()):
+            break
+        
+        u = xp.random.random(batch_size).astype(xp.float32)
+        next_states = (cdf[current_states] < u[:, None]).sum(axis=1).astype(xp.int32)
+        current_states = xp.where(active_rallies, next_states, current_states)
+        rally_lengths += active_rallies
+    
+    return xp.asnumpy(rally_lengths) if xp is not np else rally_lengths
+
+
+def simulate_rallies_jax(transition_matrix, initial_state_idx, batch_size, max_steps=50, seed=0):
+    """Run the vectorized rally sampler as one XLA-compiled program.
+    
+    The step loop is expressed with jax.lax.scan over pre-split PRNG keys, so
+    the whole simulation compiles to a single kernel for CPU, GPU or TPU.
+    """
+    cdf, is_terminal = _transition_cdf(transition_matrix)
+    cdf = jnp.asarray(cdf, dtype=jnp.float32)
+    is_terminal = jnp.asarray(is_terminal)
+    
+    def step(carry, key):
+        current_states, rally_lengths = carry
+        active_rallies = ~is_terminal[current_states]
+        u = jax.random.uniform(key, (batch_size,), dtype=jnp.float32)
+        next_states = (cdf[current_states] < u[:, None]).sum(axis=1).astype(jnp.int32)
+        current_states = jnp.where(active_rallies, next_states, current_states)
+        return (current_states, rally_lengths + active_rallies.astype(jnp.int32)), None
+    
+    @jax.jit
+    def run(key):
+        initial = (jnp.full(batch_size, initial_state_idx, dtype=jnp.int32),
+                   jnp.zeros(batch_size, dtype=jnp.int32))
+        (_, rally_lengths), _ = jax.lax.scan(step, initial, jax.random.split(key, max_steps))
+        return rally_lengths
+    
+    return np.asarray(run(jax.random.PRNGKey(seed)))
+
+
+def create_optimized_gpu_simulation(transition_matrix, state_to_idx, batch_size=100000):
+    """Run the device samplers and print the GPU implementation strategy."""
+    
+    sm = create_beach_volleyball_state_machine()
+    initial_state_idx = state_to_idx[sm.initial_state]
+    
+    print(f"\nDevice Sampler Benchmark ({batch_size:,} rallies):")
+    print("=" * 50)
+    
+    backend = "CuPy (GPU)" if xp is not np else "NumPy (CPU fallback, CuPy not installed)"
+    start_time = time.time()
+    rally_lengths = simulate_rallies_xp(transition_matrix, initial_state_idx, batch_size)
+    print(f"{backend}: {time.time() - start_time:.3f}s, "
+          f"average rally length {np.mean(rally_lengths):.1f} steps")
+    
+    if jax is not None:
+        # First call includes XLA compilation; time the second
+        simulate_rallies_jax(transition_matrix, initial_state_idx, batch_size)
+        start_time = time.time()
+        rally_lengths = simulate_rallies_jax(transition_matrix, initial_state_idx, batch_size, seed=1)
+        print(f"JAX ({jax.default_backend()}): {time.time() - start_time:.3f}s, "
+              f"average rally length {np.mean(rally_lengths):.1f} steps")
+    else:
+        print("JAX not installed - skipping XLA sampler")
     
     print(f"\nOptimized GPU Implementation Strategy:")
     print("=" * 50)
@@ -159,4 +308,4 @@ def create_optimized_gpu_simulation():
 
 if __name__ == "__main__":
     transition_matrix, state_mapping, states = test_gpu_feasibility()
-    create_optimized_gpu_simulation()
\ No newline at end of file
+    create_optimized_gpu_simulation(transition_matrix, state_mapping)
\ No newline at end of file
@@ -5,7 +5,7 @@
 """Main entry point for the beach volleyball state machine."""
 
 import argparse
-from tests.test_functions import run_comprehensive_tests
+from tests.test_functions import run_comprehensive_tests, run_benchmarks
 
 
 def simulate_points(num_points: int) -> None:
@@ -39,6 +39,7 @@ def main() -> None:
         epilog="""
 Examples:
   python main.py --test         # Run comprehensive tests
+  python main.py --benchmark    # Time the match checks on the compiled simulator
   python main.py --points 20    # Simulate 20 points
   python main.py                # Show basic usage information
         """
@@ -50,6 +51,12 @@ Examples:
         help='Run comprehensive tests and demonstrations of the state machine'
     )
     
+    parser.add_argument(
+        '--benchmark',
+        action='store_true',
+        help='Run the match points checks on 1,000,000 points without output (needs numpy and numba)'
+    )
+    
     parser.add_argument(
         '--points',
         type=int,
@@ -64,6 +71,8 @@ Examples:
     
     if args.test:
         run_comprehensive_tests()
+    elif args.benchmark:
+        run_benchmarks()
     elif args.points is not None:
         simulate_points(args.points)
     else:
@@ -4,17 +4,19 @@
 # ///
 """Match-level simulation functions for beach volleyball."""
 
-from typing import Dict, List, Tuple
-from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+import random
 from types_ import ProbabilityTransitions
+from state_machine import RallyStateMachine
 from state_machine_builder import create_state_machine_from_teams
-from rally_simulator import simulate_complete_rally
+from rally_simulator import simulate_rally_outcome
 
 
 def simulate_match_points(
     team_a_template: ProbabilityTransitions, 
     team_b_template: ProbabilityTransitions, 
-    num_points: int
+    num_points: int,
+    seed: Optional[int] = None
 ) -> float:
     """Simulate a specified number of points alternating serving teams.
     
@@ -22,6 +24,8 @@ def simulate_match_points(
         team_a_template: Complete probability transitions for team A (both serving and receiving)
         team_b_template: Complete probability transitions for team B (both serving and receiving) 
         num_points: Number of points to simulate
+        seed: If given, all points draw from one random.Random(seed), making
+            the result reproducible; otherwise the module-level generator is used
         
     Returns:
         float: Win percentage for team A
@@ -29,39 +33,47 @@ def simulate_match_points(
     if not team_a_template or not team_b_template:
         raise ValueError("Team templates cannot be empty")
     
+    # Only two configurations exist (A serving, B serving): build each once
+    a_serves, b_serves = build_serving_state_machines(team_a_template, team_b_template)
+    
+    rng = None if seed is None else random.Random(seed)
     team_a_wins = 0
     
     for point in range(num_points):
         # Alternate serving team based on point number
-        if point % 2 == 0:
-            # Team A serves, Team B receives
-            serving_states, _ = _separate_team_states(team_a_template)
-            _, receiving_states = _separate_team_states(team_b_template)
-            serving_team_is_a = True
-        else:
-            # Team B serves, Team A receives
-            serving_states, _ = _separate_team_states(team_b_template)
-            _, receiving_states = _separate_team_states(team_a_template)
-            serving_team_is_a = False
-            
-        # Combine states for this point
-        combined_states = {**serving_states, **receiving_states}
+        serving_team_is_a = point % 2 == 0
+        sm = a_serves if serving_team_is_a else b_serves
         
-        # Create state machine for this point
-        sm = create_state_machine_from_teams(combined_states, {})
-        rally_sequence, outcome = simulate_complete_rally(sm)
+        winner = simulate_rally_outcome(sm, rng=rng)
         
         # Determine winner based on serving team and outcome
-        if "serving" in outcome:
+        if winner == "serving":
             if serving_team_is_a:
                 team_a_wins += 1
-        elif "receiving" in outcome:
+        elif winner == "receiving":
             if not serving_team_is_a:
                 team_a_wins += 1
     
     return team_a_wins / num_points
 
 
+def build_serving_state_machines(
+    team_a_template: ProbabilityTransitions, 
+    team_b_template: ProbabilityTransitions
+) -> Tuple[RallyStateMachine, RallyStateMachine]:
+    """Build the state machines for team A serving and for team B serving.
+    
+    Serving (s_) states come from the serving team's template and receiving
+    (r_) states from the other team's.
+    """
+    a_serving_states, a_receiving_states = _separate_team_states(team_a_template)
+    b_serving_states, b_receiving_states = _separate_team_states(team_b_template)
+    
+    a_serves = create_state_machine_from_teams({**a_serving_states, **b_receiving_states}, {})
+    b_serves = create_state_machine_from_teams({**b_serving_states, **a_receiving_states}, {})
+    return a_serves, b_serves
+
+
 def _separate_team_states(team_template: ProbabilityTransitions) -> Tuple[
     ProbabilityTransitions, ProbabilityTransitions
 ]:
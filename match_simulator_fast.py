@@ -0,0 +1,169 @@
+# /// script
+# requires-python = ">=3.9"
+# dependencies = ["numpy", "numba"]
+# ///
+"""Match-level simulation with a Numba-compiled kernel.
+
+Same model as match_simulator.py: points alternate serve, team A serving
+the even ones. All points run in one parallel compiled call.
+"""
+
+from typing import Optional
+import numba as nb
+import numpy as np
+from types_ import ProbabilityTransitions
+from match_simulator import build_serving_state_machines
+from rally_simulator_fast import (
+    CSRStateMachine, SERVING_WINS, RECEIVING_WINS, encode_csr, walk_rally, simulate_many_rallies,
+    _draw_block, _DRAW_BLOCK_RALLIES
+)
+
+
+@nb.njit(parallel=True, cache=True, nogil=True)
+def simulate_match_batch(a_indptr, a_next_ids, a_thresholds, a_is_terminal, a_winner, a_initial,
+                         b_indptr, b_next_ids, b_thresholds, b_is_terminal, b_winner, b_initial,
+                         max_steps, first_point, u, keys, out_a_wins):
+    """Simulate len(out_a_wins) points, writing 1 where team A wins the point.
+    
+    The a_* arrays encode the machine with team A serving and the b_* arrays
+    the one with team B serving. Point first_point + p is served by A when
+    even, and takes its pre-sampled uniforms from u[p] and its overflow key
+    from keys[p] (see walk_rally).
+    """
+    for p in nb.prange(out_a_wins.shape[0]):
+        if (first_point + p) % 2 == 0:
+            code = walk_rally(a_indptr, a_next_ids, a_thresholds, a_is_terminal, a_winner,
+                              a_initial, max_steps, u[p], keys[p])
+            out_a_wins[p] = code == SERVING_WINS
+        else:
+            code = walk_rally(b_indptr, b_next_ids, b_thresholds, b_is_terminal, b_winner,
+                              b_initial, max_steps, u[p], keys[p])
+            out_a_wins[p] = code == RECEIVING_WINS
+
+
+def simulate_match_points_fast(
+    team_a_template: ProbabilityTransitions,
+    team_b_template: ProbabilityTransitions,
+    num_points: int,
+    seed: Optional[int] = None,
+    max_steps: int = 50,
+    antithetic: bool = False
+) -> float:
+    """Compiled counterpart of match_simulator.simulate_match_points.
+    
+    Runs with the same seed and num_points use the same draws for every
+    point and step, whatever the number of Numba threads, so comparing two
+    matchups under one seed gives common random numbers. With
+    antithetic=True, the second half of each block of points replays the
+    first half's pre-sampled draws complemented (u -> 1 - u), pairing
+    points served by the same team; the rare steps past them are not paired.
+    
+    Returns:
+        float: Win percentage for team A
+    """
+    if not team_a_template or not team_b_template:
+        raise ValueError("Team templates cannot be empty")
+    
+    a_serves, b_serves = build_serving_state_machines(team_a_template, team_b_template)
+    return simulate_match_points_csr(encode_csr(a_serves), encode_csr(b_serves), num_points,
+                                     seed=seed, max_steps=max_steps, antithetic=antithetic)
+
+
+def simulate_match_points_csr(
+    a_csr: CSRStateMachine,
+    b_csr: CSRStateMachine,
+    num_points: int,
+    seed: Optional[int] = None,
+    max_steps: int = 50,
+    antithetic: bool = False
+) -> float:
+    """simulate_match_points_fast on already encoded machines.
+    
+    a_csr is the machine with team A serving and b_csr the one with team B
+    serving (see match_simulator.build_serving_state_machines). Draws are
+    the same as simulate_match_points_fast's for the same seed.
+    
+    Returns:
+        float: Win percentage for team A
+    """
+    rng = np.random.default_rng(seed)
+    
+    a_wins = np.empty(num_points, dtype=np.int8)
+    for start in range(0, num_points, _DRAW_BLOCK_RALLIES):
+        block = a_wins[start:start + _DRAW_BLOCK_RALLIES]
+        if antithetic:
+            # An even half keeps each point and its antithetic partner on the same server
+            half = (block.shape[0] + 3) // 4 * 2
+            # Overflow draws past the pre-sampled steps are not paired, the
+            # partner just gets its own key
+            u, keys = _draw_block(rng, half)
+            u = np.concatenate([u, ~u])[:block.shape[0]]
+            keys = np.concatenate([keys, ~keys])[:block.shape[0]]
+        else:
+            u, keys = _draw_block(rng, block.shape[0])
+        simulate_match_batch(a_csr.indptr, a_csr.next_ids, a_csr.thresholds, a_csr.is_terminal,
+                             a_csr.winner, a_csr.initial,
+                             b_csr.indptr, b_csr.next_ids, b_csr.thresholds, b_csr.is_terminal,
+                             b_csr.winner, b_csr.initial,
+                             max_steps, start, u, keys, block)
+    
+    return int(np.count_nonzero(a_wins)) / num_points
+
+
+def simulate_match_points_vec(
+    team_a_template: ProbabilityTransitions,
+    team_b_template: ProbabilityTransitions,
+    num_points: int,
+    seed: Optional[int] = None,
+    max_steps: int = 50
+) -> float:
+    """NumPy-only counterpart of simulate_match_points_fast, for use without the JIT.
+    
+    Each serving configuration runs its points as one vectorized batch (see
+    rally_simulator_fast.simulate_many_rallies).
+    
+    Returns:
+        float: Win percentage for team A
+    """
+    if not team_a_template or not team_b_template:
+        raise ValueError("Team templates cannot be empty")
+    
+    a_serves, b_serves = build_serving_state_machines(team_a_template, team_b_template)
+    
+    # Independent streams for the two batches, both derived from seed
+    a_seed, b_seed = (None, None) if seed is None else np.random.SeedSequence(seed).generate_state(2)
+    
+    a_final, _ = simulate_many_rallies(a_serves, (num_points + 1) // 2, max_steps, a_seed)
+    b_final, _ = simulate_many_rallies(b_serves, num_points // 2, max_steps, b_seed)
+    
+    team_a_wins = (np.count_nonzero(encode_csr(a_serves).winner[a_final] == SERVING_WINS)
+                   + np.count_nonzero(encode_csr(b_serves).winner[b_final] == RECEIVING_WINS))
+    return team_a_wins / num_points
+
+
+if __name__ == "__main__":
+    import time
+    from match_simulator import simulate_match_points
+    from state_definitions import create_beach_volleyball_state_machine
+    from elasticity_analysis import convert_state_machine_to_template
+    
+    template = convert_state_machine_to_template(create_beach_volleyball_state_machine())
+    
+    # Warm up (compiles the kernel, or loads it from the cache)
+    simulate_match_points_fast(template, template, 10, seed=0)
+    
+    for num_points in (10_000, 1_000_000):
+        start = time.perf_counter()
+        win_rate = simulate_match_points_fast(template, template, num_points, seed=0)
+        elapsed = time.perf_counter() - start
+        print(f"Fast:   {num_points:>9,} points | win rate {win_rate:.4f} | {elapsed:.3f}s")
+    
+    start = time.perf_counter()
+    win_rate = simulate_match_points_vec(template, template, 1_000_000, seed=0)
+    elapsed = time.perf_counter() - start
+    print(f"NumPy:  {1_000_000:>9,} points | win rate {win_rate:.4f} | {elapsed:.3f}s")
+    
+    start = time.perf_counter()
+    win_rate = simulate_match_points(template, template, 10_000)
+    elapsed = time.perf_counter() - start
+    print(f"Python: {10_000:>9,} points | win rate {win_rate:.4f} | {elapsed:.3f}s")
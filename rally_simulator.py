@@ -6,8 +6,8 @@
 
 from typing import Optional, List, Tuple
 import random
+from bisect import bisect
 from state_machine import RallyStateMachine
-from state_definitions import get_winning_team
 
 
 def simulate_rally_step(state_machine: RallyStateMachine, current_state: str) -> Optional[str]:
@@ -16,42 +16,90 @@ def simulate_rally_step(state_machine: RallyStateMachine, current_state: str) ->
     if state_machine.is_terminal_state(current_state):
         return None
     
-    transitions = state_machine.get_next_states(current_state)
-    if not transitions:
-        return None
-    
-    # Extract states and probabilities for weighted random selection
-    states = [transition[0] for transition in transitions]
-    probabilities = [float(transition[1]) for transition in transitions]
-    
-    # Use weighted random choice based on probabilities
-    selected_state = random.choices(states, weights=probabilities, k=1)[0]
-    return selected_state
+    return state_machine.sample_next(current_state, random.random())
 
 
-def simulate_complete_rally(state_machine: RallyStateMachine, max_steps: int = 50) -> Tuple[List[str], str]:
-    """Simulate a complete rally from start to finish."""
+def _walk(state_machine: RallyStateMachine, max_steps: int, rng: Optional[random.Random],
+          visited: Optional[List[int]] = None) -> Tuple[int, int]:
+    """Walk one rally on integer state ids and return (final state id, steps taken).
     
-    rally_sequence = []
-    current_state = state_machine.initial_state
+    Draws come from `rng` if given, otherwise from the module-level
+    generator. If `visited` is given, the id of every non-terminal state the
+    rally passes through is appended to it. The final state is not terminal
+    if the rally exceeded max_steps or hit a dead end.
+    """
+    
+    encoded = state_machine.encoded
+    next_ids, cum_probs, is_terminal = encoded.next_ids, encoded.cum_probs, encoded.is_terminal
+    
+    # Bind hot-loop callables to locals to skip attribute lookups per step
+    uniform = random.random if rng is None else rng.random
+    search = bisect
+    append = None if visited is None else visited.append
+    current = encoded.initial_id
     step = 0
     
-    while not state_machine.is_terminal_state(current_state) and step < max_steps:
-        rally_sequence.append(current_state)
-        next_state = simulate_rally_step(state_machine, current_state)
+    while not is_terminal[current] and step < max_steps:
+        if append is not None:
+            append(current)
+        candidates = next_ids[current]
         
-        if next_state is None:
+        if not candidates:
             break
-            
-        current_state = next_state
+        
+        current = candidates[search(cum_probs[current], uniform())]
         step += 1
     
+    return current, step
+
+
+def simulate_complete_rally(state_machine: RallyStateMachine, max_steps: int = 50,
+                            rng: Optional[random.Random] = None) -> Tuple[List[str], str]:
+    """Simulate a complete rally from start to finish.
+    
+    The loop runs on integer state ids; names are mapped back only for the
+    returned sequence. Draws come from `rng` if given, otherwise from the
+    module-level generator.
+    """
+    
+    sequence_ids: List[int] = []
+    current, _ = _walk(state_machine, max_steps, rng, sequence_ids)
+    
+    states = state_machine.sorted_states
+    rally_sequence = [states[state_id] for state_id in sequence_ids]
+    
     # Add the final terminal state
-    if state_machine.is_terminal_state(current_state):
-        rally_sequence.append(current_state)
-        winner = get_winning_team(current_state)
+    if state_machine.encoded.is_terminal[current]:
+        rally_sequence.append(states[current])
+        winner = state_machine.winner_by_id[current]
         outcome = f"{winner} team wins"
     else:
         outcome = f"Rally exceeded {max_steps} steps"
     
     return rally_sequence, outcome
+
+
+def simulate_rally_outcome(state_machine: RallyStateMachine, max_steps: int = 50,
+                           rng: Optional[random.Random] = None) -> Optional[str]:
+    """Simulate a rally and return only the winning team ("serving" or "receiving").
+    
+    Same draws as simulate_complete_rally, without building the state
+    sequence. Returns None if the rally exceeds max_steps.
+    """
+    
+    current, _ = _walk(state_machine, max_steps, rng)
+    return state_machine.winner_by_id[current]
+
+
+def simulate_complete_rally_terminal(state_machine: RallyStateMachine, max_steps: int = 50,
+                                     rng: Optional[random.Random] = None) -> Tuple[str, int]:
+    """Simulate a rally and return only (final state, number of states in the rally).
+    
+    Same draws as simulate_complete_rally, keeping a step counter instead of
+    the sequence; for a finished rally the pair equals
+    (rally_sequence[-1], len(rally_sequence)). The final state is not
+    terminal if the rally exceeded max_steps.
+    """
+    
+    current, step = _walk(state_machine, max_steps, rng)
+    return state_machine.sorted_states[current], step + 1
@@ -4,25 +4,74 @@
 # ///
 """Core state machine implementation for beach volleyball."""
 
-from typing import Dict, List, Set
-from dataclasses import dataclass
-from decimal import Decimal
+from typing import AbstractSet, Dict, FrozenSet, Mapping, NamedTuple, Optional, Sequence, Tuple
+from dataclasses import dataclass, field
+from functools import cached_property
+from itertools import accumulate
+from bisect import bisect
+from array import array
 from types_ import StateTransitionTuple
 
 
-@dataclass
+# Maximum allowed deviation of a state's probability total from 1.0
+PROBABILITY_TOLERANCE = 1e-6
+
+
+class EncodedTransitions(NamedTuple):
+    """Integer-encoded transitions, indexed by state id (position in sorted_states)."""
+    
+    next_ids: Tuple[Tuple[int, ...], ...]
+    cum_probs: Tuple[Tuple[float, ...], ...]
+    # Terminal flags stay a tuple rather than an int bitmask: in CPython
+    # is_terminal[i] is a single subscript (~10ns), while mask >> i & 1 is
+    # two arithmetic ops on an int object (~35ns)
+    is_terminal: Tuple[bool, ...]
+    initial_id: int
+
+
+class CSRTransitions(NamedTuple):
+    """Transitions as flat typed arrays (structure of arrays), indexed by state id.
+    
+    The successors of state i are next_ids[row_starts[i]:row_starts[i + 1]],
+    with matching cumulative probabilities in cum_probs; is_terminal holds
+    one 0/1 byte per state. The arrays support the buffer protocol, so NumPy can wrap them
+    without copying.
+    """
+    
+    row_starts: array
+    next_ids: array
+    cum_probs: array
+    is_terminal: array
+
+
+def _classify_team(state: str) -> str:
+    """Acting team for a state name, from its 's_' / 'r_' prefix."""
+    if state.startswith('s_'):
+        return 'serving'
+    elif state.startswith('r_'):
+        return 'receiving'
+    else:
+        return 'terminal'
+
+
+@dataclass(frozen=True)
 class RallyStateMachine:
     """Dictionary-based rally state machine for beach volleyball.
     
     This class encapsulates the state machine logic using a dictionary representation
     where each state maps to possible transitions with their probabilities and action types.
+    
+    Instances are frozen because the derived views below are cached on first
+    use and would go stale if a field were reassigned.
     """
     
-    transitions: Dict[str, List[StateTransitionTuple]]
-    terminal_states: Set[str]
+    transitions: Mapping[str, Sequence[StateTransitionTuple]]
+    terminal_states: AbstractSet[str]
     initial_state: str = "s_serve_ready"
+    _sampling_table: Dict[str, Optional[Tuple[Tuple[str, ...], Tuple[float, ...]]]] = field(
+        default_factory=dict, init=False, repr=False, compare=False)
     
-    def get_next_states(self, current_state: str) -> List[StateTransitionTuple]:
+    def get_next_states(self, current_state: str) -> Sequence[StateTransitionTuple]:
         """Get possible next states from current state."""
         if current_state not in self.transitions:
             raise ValueError(f"Invalid state: {current_state}")
@@ -34,41 +83,180 @@ class RallyStateMachine:
     
     def is_valid_transition(self, from_state: str, to_state: str) -> bool:
         """Check if a transition between states is valid."""
-        if from_state not in self.transitions:
-            return False
-        valid_next_states = [transition[0] for transition in self.transitions[from_state]]
-        return to_state in valid_next_states
+        valid_next_states = self._valid_next_states.get(from_state)
+        return valid_next_states is not None and to_state in valid_next_states
     
     def get_acting_team(self, state: str) -> str:
         """Get which team is acting in the given state."""
-        if state.startswith('s_'):
-            return 'serving'
-        elif state.startswith('r_'):
-            return 'receiving'
-        else:
-            return 'terminal'
-    
-    def get_all_states(self) -> Set[str]:
-        """Get all states in the state machine."""
-        all_states = set(self.transitions.keys())
-        all_states.update(self.terminal_states)
-        return all_states
-    
-    def get_continuation_states(self) -> Set[str]:
-        """Get all non-terminal states."""
-        return self.get_all_states() - self.terminal_states
+        team = self._team_by_state.get(state)
+        return team if team is not None else _classify_team(state)
     
-    def validate_probabilities(self) -> bool:
-        """Validate that all transition probabilities sum to 1.0 for each state."""
-        from decimal import Decimal
+    @cached_property
+    def _valid_next_states(self) -> Dict[str, FrozenSet[str]]:
+        return {state: frozenset(transition[0] for transition in transitions)
+                for state, transitions in self.transitions.items()}
+    
+    @cached_property
+    def _team_by_state(self) -> Dict[str, str]:
+        return {state: _classify_team(state) for state in self._all_states}
+    
+    @cached_property
+    def _all_states(self) -> FrozenSet[str]:
+        return frozenset(self.transitions.keys()) | frozenset(self.terminal_states)
+    
+    @cached_property
+    def _continuation_states(self) -> FrozenSet[str]:
+        return self._all_states - self.terminal_states
+    
+    @cached_property
+    def sorted_states(self) -> Tuple[str, ...]:
+        """All states in sorted order, the canonical index order for matrix views."""
+        return tuple(sorted(self._all_states))
+    
+    @cached_property
+    def sorted_terminal_states(self) -> Tuple[str, ...]:
+        """Terminal states in sorted order."""
+        return tuple(sorted(self.terminal_states))
+    
+    @cached_property
+    def state_to_idx(self) -> Dict[str, int]:
+        """Map each state to its position in sorted_states."""
+        return {state: i for i, state in enumerate(self.sorted_states)}
+    
+    @cached_property
+    def encoded(self) -> EncodedTransitions:
+        """Integer-encoded view of the transitions for id-based rally loops.
+        
+        States without transitions (terminal ones included) get empty rows.
+        Cumulative probabilities end at exactly 1.0 like get_sampling_entry.
+        Raises ValueError if a successor is neither a state with transitions
+        nor a terminal state.
+        """
+        state_to_idx = self.state_to_idx
+        next_ids = []
+        cum_probs = []
+        for state in self.sorted_states:
+            entry = self.get_sampling_entry(state) if state in self.transitions else None
+            if entry is None:
+                next_ids.append(())
+                cum_probs.append(())
+            else:
+                next_states, cumulative = entry
+                try:
+                    next_ids.append(tuple(state_to_idx[next_state] for next_state in next_states))
+                except KeyError as e:
+                    raise ValueError(f"Invalid state: {e.args[0]} (successor of {state})") from None
+                cum_probs.append(cumulative)
+        
+        return EncodedTransitions(
+            next_ids=tuple(next_ids),
+            cum_probs=tuple(cum_probs),
+            is_terminal=tuple(state in self.terminal_states for state in self.sorted_states),
+            initial_id=state_to_idx[self.initial_state]
+        )
+    
+    @cached_property
+    def csr(self) -> CSRTransitions:
+        """CSR-style typed arrays built from the encoded transitions."""
+        encoded = self.encoded
+        row_starts = array('i', [0])
+        for row in encoded.next_ids:
+            row_starts.append(row_starts[-1] + len(row))
+        
+        return CSRTransitions(
+            row_starts=row_starts,
+            next_ids=array('i', [i for row in encoded.next_ids for i in row]),
+            cum_probs=array('d', [p for row in encoded.cum_probs for p in row]),
+            is_terminal=array('b', encoded.is_terminal)
+        )
+    
+    @cached_property
+    def winner_by_id(self) -> Tuple[Optional[str], ...]:
+        """Winning team ("serving" or "receiving") per state id, None for non-terminal states."""
+        # Deferred import: state_definitions imports this module
+        from state_definitions import get_winning_team
+        return tuple(get_winning_team(state) if terminal else None
+                     for state, terminal in zip(self.sorted_states, self.encoded.is_terminal))
+    
+    def is_terminal_id(self, state_id: int) -> bool:
+        """Check if the state with this id is terminal."""
+        return self.encoded.is_terminal[state_id]
+    
+    def sample_next_id(self, state_id: int, u: float) -> int:
+        """Map a uniform draw u in [0, 1) to the next state id from `state_id`.
+        
+        The state must have transitions.
+        """
+        encoded = self.encoded
+        return encoded.next_ids[state_id][bisect(encoded.cum_probs[state_id], u)]
+    
+    def get_sampling_entry(self, state: str) -> Optional[Tuple[Tuple[str, ...], Tuple[float, ...]]]:
+        """Return (next states, cumulative probabilities) for sampling from `state`.
+        
+        Entries are built on first use and cached per instance, so a state
+        machine pays only for the states its rallies actually visit. The last
+        cumulative probability is pinned to exactly 1.0 so a uniform draw in
+        [0, 1) always selects a state. Returns None for states without
+        transitions.
+        """
+        try:
+            return self._sampling_table[state]
+        except KeyError:
+            pass
         
+        transitions = self.get_next_states(state)
+        entry = None
+        if transitions:
+            cumulative = list(accumulate(transition[1] for transition in transitions))
+            cumulative[-1] = 1.0
+            entry = (tuple(transition[0] for transition in transitions), tuple(cumulative))
+        self._sampling_table[state] = entry
+        return entry
+    
+    def sample_next(self, state: str, u: float) -> Optional[str]:
+        """Map a uniform draw u in [0, 1) to the next state from `state`.
+        
+        Returns None for states without transitions.
+        """
+        entry = self.get_sampling_entry(state)
+        if entry is None:
+            return None
+        next_states, cumulative = entry
+        return next_states[bisect(cumulative, u)]
+    
+    def get_all_states(self) -> FrozenSet[str]:
+        """Get all states in the state machine.
+        
+        Computed once per instance: transitions and terminal_states are not
+        expected to change after construction.
+        """
+        return self._all_states
+    
+    def get_continuation_states(self) -> FrozenSet[str]:
+        """Get all non-terminal states."""
+        return self._continuation_states
+    
+    @cached_property
+    def _invalid_row(self) -> Optional[Tuple[str, float]]:
+        """First state whose transition probabilities do not sum to 1.0, with that sum."""
         for state, transitions in self.transitions.items():
             if not transitions:
                 continue
-                
+            
             total_probability = sum(transition[1] for transition in transitions)
-            if abs(total_probability - Decimal("1.0")) > Decimal("0.001"):
-                print(f"Warning: State {state} probabilities sum to {total_probability}, not 1.0")
-                return False
+            if abs(float(total_probability) - 1.0) > PROBABILITY_TOLERANCE:
+                return state, total_probability
+        return None
+    
+    def validate_probabilities(self) -> bool:
+        """Validate that all transition probabilities sum to 1.0 for each state.
+        
+        The check runs once per instance; later calls only repeat the warning.
+        """
+        invalid_row = self._invalid_row
+        if invalid_row is None:
+            return True
         
-        return True
+        state, total_probability = invalid_row
+        print(f"Warning: State {state} probabilities sum to {total_probability}, not 1.0")
+        return False
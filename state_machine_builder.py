@@ -4,73 +4,111 @@
 # ///
 """Functions for building custom state machines from team probabilities."""
 
-from typing import Dict, List, Tuple
-from decimal import Decimal
+from typing import Dict, Sequence, Tuple
+from functools import lru_cache
+from types import MappingProxyType
 from types_ import StateTransitionTuple, ActionType, ProbabilityTransitions
-from state_machine import RallyStateMachine
-from state_definitions import create_beach_volleyball_state_machine
+from state_machine import RallyStateMachine, PROBABILITY_TOLERANCE
+from state_definitions import create_beach_volleyball_state_machine, TERMINAL_STATES, INITIAL_STATE
+
+
+# Substring -> action type, checked in order (e.g. "serve" before "set")
+_ACTION_KEYWORDS: Tuple[Tuple[str, ActionType], ...] = (
+    ('serve', ActionType.SERVE),
+    ('reception', ActionType.RECEPTION),
+    ('set', ActionType.SET),
+    ('attack', ActionType.ATTACK),
+    ('dig', ActionType.DIG),
+    ('block', ActionType.BLOCK),
+)
+
+
+# Team probabilities in hashable form: ((state, ((next_state, prob), ...)), ...)
+FrozenProbabilities = Tuple[Tuple[str, Tuple[Tuple[str, float], ...]], ...]
 
 
 def create_state_machine_from_teams(
     team_serving_probs: ProbabilityTransitions, 
     team_receiving_probs: ProbabilityTransitions
 ) -> RallyStateMachine:
-    """Create a custom state machine from team-specific probability dictionaries."""
+    """Create a custom state machine from team-specific probability dictionaries.
     
-    # Start with the default state machine structure
-    default_sm = create_beach_volleyball_state_machine()
+    Machines are cached by their input probabilities, so equal inputs (e.g.
+    the same template on both sides) share one machine. Its transitions
+    mapping and terminal set are read-only; copy them to derive a new one.
+    """
+    return _create_state_machine(_freeze(team_serving_probs), _freeze(team_receiving_probs))
+
+
+def _freeze(probs: ProbabilityTransitions) -> FrozenProbabilities:
+    """Convert a probability dictionary into a hashable cache key, keeping state order."""
+    return tuple((state, tuple(map(tuple, transitions))) for state, transitions in probs.items())
+
+
+@lru_cache(maxsize=32)
+def _create_state_machine(
+    team_serving_probs: FrozenProbabilities,
+    team_receiving_probs: FrozenProbabilities
+) -> RallyStateMachine:
+    """Build the state machine for create_state_machine_from_teams."""
     
-    # Create a copy of the default transitions
-    custom_transitions: Dict[str, List[StateTransitionTuple]] = {}
+    custom_transitions: Dict[str, Sequence[StateTransitionTuple]] = {}
     
     # Process serving team probabilities
-    for state, prob_transitions in team_serving_probs.items():
+    for state, prob_transitions in team_serving_probs:
         _validate_state_probabilities(state, prob_transitions)
-        custom_transitions[state] = [
-            (next_state, prob, _infer_action_type(state))
+        action_type = _infer_action_type(state)
+        custom_transitions[state] = tuple(
+            (next_state, prob, action_type)
             for next_state, prob in prob_transitions
-        ]
+        )
     
     # Process receiving team probabilities
-    for state, prob_transitions in team_receiving_probs.items():
+    for state, prob_transitions in team_receiving_probs:
         _validate_state_probabilities(state, prob_transitions)
-        custom_transitions[state] = [
-            (next_state, prob, _infer_action_type(state))
+        action_type = _infer_action_type(state)
+        custom_transitions[state] = tuple(
+            (next_state, prob, action_type)
             for next_state, prob in prob_transitions
-        ]
+        )
     
+    # Read-only views, since every caller with equal input shares this machine
     return RallyStateMachine(
-        transitions=custom_transitions,
-        terminal_states=default_sm.terminal_states,
-        initial_state=default_sm.initial_state
+        transitions=MappingProxyType(custom_transitions),
+        terminal_states=TERMINAL_STATES,
+        initial_state=INITIAL_STATE
     )
 
 
 def _infer_action_type(state_name: str) -> ActionType:
     """Infer the action type from the state name."""
-    if 'serve' in state_name:
-        return ActionType.SERVE
-    elif 'reception' in state_name:
-        return ActionType.RECEPTION
-    elif 'set' in state_name:
-        return ActionType.SET
-    elif 'attack' in state_name:
-        return ActionType.ATTACK
-    elif 'dig' in state_name:
-        return ActionType.DIG
-    elif 'block' in state_name:
-        return ActionType.BLOCK
-    elif 'transition' in state_name:
-        return ActionType.TRANSITION
-    else:
-        return ActionType.TRANSITION
-
-
-def _validate_state_probabilities(state: str, transitions: List[Tuple[str, Decimal]]) -> None:
+    action_type = _ACTION_BY_STATE.get(state_name)
+    if action_type is not None:
+        return action_type
+    return _match_action_keyword(state_name)
+
+
+def _match_action_keyword(state_name: str) -> ActionType:
+    """Return the action type of the first keyword found in the state name."""
+    for keyword, action_type in _ACTION_KEYWORDS:
+        if keyword in state_name:
+            return action_type
+    return ActionType.TRANSITION
+
+
+def _validate_state_probabilities(state: str, transitions: Sequence[Tuple[str, float]]) -> None:
     """Validate that probabilities for a state sum to 1.0."""
     total_prob = sum(prob for _, prob in transitions)
-    if abs(total_prob - Decimal("1.0")) > Decimal("0.001"):
+    if abs(total_prob - 1.0) > PROBABILITY_TOLERANCE:
         raise ValueError(
             f"Probabilities for state '{state}' sum to {total_prob}, not 1.0. "
             f"Transitions: {transitions}"
         )
+
+
+# Action type of every state in the default machine, so custom builds
+# resolve known states with one lookup instead of a keyword scan
+_ACTION_BY_STATE: Dict[str, ActionType] = {
+    state: _match_action_keyword(state)
+    for state in create_beach_volleyball_state_machine().get_all_states()
+}
@@ -4,11 +4,22 @@
 # ///
 """Pre-defined team probability templates for different skill levels."""
 
-from typing import Dict, List, Tuple
-from decimal import Decimal
+from typing import Dict, Iterable, List, Tuple
 from types_ import ProbabilityTransitions
 
 
+# Interned transition rows: equal rows share one tuple across the built-in
+# templates. Only the static templates are interned, so the pool stays
+# bounded; rows of arbitrary caller input are not pooled.
+_TRANSITION_POOL: Dict[tuple, tuple] = {}
+
+
+def intern_transitions(transitions: Iterable[tuple]) -> tuple:
+    """Return the pooled tuple equal to `transitions`, pooling it on first use."""
+    row = tuple(transitions)
+    return _TRANSITION_POOL.setdefault(row, row)
+
+
 def get_common_state_templates() -> Dict[str, ProbabilityTransitions]:
     """Get common probability templates for different team skill levels."""
     
@@ -16,109 +27,112 @@ def get_common_state_templates() -> Dict[str, ProbabilityTransitions]:
         "elite_team": {
             # Serving states
             "s_serve_ready": [
-                ("s_serve_ace", Decimal("0.12")),
-                ("s_serve_error", Decimal("0.04")),
-                ("s_serve_in_play", Decimal("0.84"))
+                ("s_serve_ace", 0.12),
+                ("s_serve_error", 0.04),
+                ("s_serve_in_play", 0.84)
             ],
             "s_dig_perfect": [
-                ("s_set_error", Decimal("0.03")),
-                ("s_set_perfect", Decimal("0.65")),
-                ("s_set_good", Decimal("0.32"))
+                ("s_set_error", 0.03),
+                ("s_set_perfect", 0.65),
+                ("s_set_good", 0.32)
             ],
             "s_dig_good": [
-                ("s_set_error", Decimal("0.10")),
-                ("s_set_perfect", Decimal("0.25")),
-                ("s_set_good", Decimal("0.55")),
-                ("s_set_poor", Decimal("0.10"))
+                ("s_set_error", 0.10),
+                ("s_set_perfect", 0.25),
+                ("s_set_good", 0.55),
+                ("s_set_poor", 0.10)
             ],
             "s_set_perfect": [
-                ("s_attack_kill", Decimal("0.60")),
-                ("s_attack_error", Decimal("0.03")),
-                ("s_attack_blocked", Decimal("0.12")),
-                ("s_attack_defended", Decimal("0.25"))
+                ("s_attack_kill", 0.60),
+                ("s_attack_error", 0.03),
+                ("s_attack_blocked", 0.12),
+                ("s_attack_defended", 0.25)
             ],
             "s_set_good": [
-                ("s_attack_kill", Decimal("0.40")),
-                ("s_attack_error", Decimal("0.08")),
-                ("s_attack_blocked", Decimal("0.22")),
-                ("s_attack_defended", Decimal("0.30"))
+                ("s_attack_kill", 0.40),
+                ("s_attack_error", 0.08),
+                ("s_attack_blocked", 0.22),
+                ("s_attack_defended", 0.30)
             ],
             "s_set_poor": [
-                ("s_attack_kill", Decimal("0.18")),
-                ("s_attack_error", Decimal("0.20")),
-                ("s_attack_blocked", Decimal("0.32")),
-                ("s_attack_defended", Decimal("0.30"))
+                ("s_attack_kill", 0.18),
+                ("s_attack_error", 0.20),
+                ("s_attack_blocked", 0.32),
+                ("s_attack_defended", 0.30)
             ],
             
             # Receiving states
             "s_serve_in_play": [
-                ("r_reception_error", Decimal("0.08")),
-                ("r_reception_perfect", Decimal("0.42")),
-                ("r_reception_good", Decimal("0.50"))
+                ("r_reception_error", 0.08),
+                ("r_reception_perfect", 0.42),
+                ("r_reception_good", 0.50)
             ],
             "r_reception_perfect": [
-                ("r_set_error", Decimal("0.03")),
-                ("r_set_perfect", Decimal("0.65")),
-                ("r_set_good", Decimal("0.32"))
+                ("r_set_error", 0.03),
+                ("r_set_perfect", 0.65),
+                ("r_set_good", 0.32)
             ],
             "r_reception_good": [
-                ("r_set_error", Decimal("0.10")),
-                ("r_set_perfect", Decimal("0.25")),
-                ("r_set_good", Decimal("0.55")),
-                ("r_set_poor", Decimal("0.10"))
+                ("r_set_error", 0.10),
+                ("r_set_perfect", 0.25),
+                ("r_set_good", 0.55),
+                ("r_set_poor", 0.10)
             ],
             "r_set_perfect": [
-                ("r_attack_kill", Decimal("0.60")),
-                ("r_attack_error", Decimal("0.03")),
-                ("r_attack_blocked", Decimal("0.12")),
-                ("r_attack_defended", Decimal("0.25"))
+                ("r_attack_kill", 0.60),
+                ("r_attack_error", 0.03),
+                ("r_attack_blocked", 0.12),
+                ("r_attack_defended", 0.25)
             ],
             "r_set_good": [
-                ("r_attack_kill", Decimal("0.40")),
-                ("r_attack_error", Decimal("0.08")),
-                ("r_attack_blocked", Decimal("0.22")),
-                ("r_attack_defended", Decimal("0.30"))
+                ("r_attack_kill", 0.40),
+                ("r_attack_error", 0.08),
+                ("r_attack_blocked", 0.22),
+                ("r_attack_defended", 0.30)
             ],
             "r_set_poor": [
-                ("r_attack_kill", Decimal("0.18")),
-                ("r_attack_error", Decimal("0.20")),
-                ("r_attack_blocked", Decimal("0.32")),
-                ("r_attack_defended", Decimal("0.30"))
+                ("r_attack_kill", 0.18),
+                ("r_attack_error", 0.20),
+                ("r_attack_blocked", 0.32),
+                ("r_attack_defended", 0.30)
             ],
             "r_attack_blocked": [
-                ("s_block_kill", Decimal("0.25")),
-                ("s_block_error", Decimal("0.15")),
-                ("s_dig_perfect", Decimal("0.30")),
-                ("s_dig_good", Decimal("0.30"))
+                ("s_block_kill", 0.25),
+                ("s_block_error", 0.15),
+                ("s_dig_perfect", 0.30),
+                ("s_dig_good", 0.30)
             ],
             "r_attack_defended": [
-                ("s_dig_error", Decimal("0.25")),
-                ("s_dig_perfect", Decimal("0.40")),
-                ("s_dig_good", Decimal("0.35"))
+                ("s_dig_error", 0.25),
+                ("s_dig_perfect", 0.40),
+                ("s_dig_good", 0.35)
             ],
             "s_attack_blocked": [
-                ("r_block_kill", Decimal("0.25")),
-                ("r_block_error", Decimal("0.15")),
-                ("r_dig_perfect", Decimal("0.30")),
-                ("r_dig_good", Decimal("0.30"))
+                ("r_block_kill", 0.25),
+                ("r_block_error", 0.15),
+                ("r_dig_perfect", 0.30),
+                ("r_dig_good", 0.30)
             ],
             "s_attack_defended": [
-                ("r_dig_error", Decimal("0.25")),
-                ("r_dig_perfect", Decimal("0.40")),
-                ("r_dig_good", Decimal("0.35"))
+                ("r_dig_error", 0.25),
+                ("r_dig_perfect", 0.40),
+                ("r_dig_good", 0.35)
             ],
             "r_dig_perfect": [
-                ("r_set_error", Decimal("0.03")),
-                ("r_set_perfect", Decimal("0.65")),
-                ("r_set_good", Decimal("0.32"))
+                ("r_set_error", 0.03),
+                ("r_set_perfect", 0.65),
+                ("r_set_good", 0.32)
             ],
             "r_dig_good": [
-                ("r_set_error", Decimal("0.10")),
-                ("r_set_perfect", Decimal("0.25")),
-                ("r_set_good", Decimal("0.55")),
-                ("r_set_poor", Decimal("0.10"))
+                ("r_set_error", 0.10),
+                ("r_set_perfect", 0.25),
+                ("r_set_good", 0.55),
+                ("r_set_poor", 0.10)
             ]
         }
     }
     
-    return templates
+    return {
+        name: {state: intern_transitions(transitions) for state, transitions in template.items()}
+        for name, template in templates.items()
+    }
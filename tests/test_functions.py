@@ -4,10 +4,17 @@
 # ///
 """Test functions for the beach volleyball state machine."""
 
-from decimal import Decimal
+from typing import Callable
+import io
+import os
+import subprocess
+import sys
 from types_ import ActionType
 from state_definitions import create_beach_volleyball_state_machine, get_winning_team
-from rally_simulator import simulate_rally_step, simulate_complete_rally
+from rally_simulator import (
+    simulate_rally_step, simulate_complete_rally, simulate_rally_outcome,
+    simulate_complete_rally_terminal
+)
 from team_templates import get_common_state_templates
 from match_simulator import simulate_match_points
 from utils.display import print_state_machine_summary
@@ -68,36 +75,51 @@ def test_rally_simulation() -> None:
         assert sm.is_terminal_state(rally_sequence[-1])
         assert "wins" in outcome
     
+    # Test terminal-only simulation
+    for _ in range(100):
+        terminal_state, length = simulate_complete_rally_terminal(sm)
+        assert length > 0
+        assert sm.is_terminal_state(terminal_state)
+    
+    # Test outcome-only simulation
+    for _ in range(100):
+        assert simulate_rally_outcome(sm) in ("serving", "receiving")
+    
     print("Rally simulation test passed!")
 
 
 def test_simulate_match_points() -> None:
     """Test the simulate_match_points function with identical teams."""
-    
-    # Single num_points variable for all tests
-    num_points = 10000
+    _run_match_points_assertions(num_points=10000, verbose=True)
+
+
+def _run_match_points_assertions(num_points: int, verbose: bool = False,
+                                 simulate: Callable[..., float] = simulate_match_points) -> None:
+    """Run the match points checks with `simulate`, printing progress only if verbose."""
     
     # Get common templates
     templates = get_common_state_templates()
     
-    print("Testing simulate_match_points function:")
-    print("=" * 45)
-    print(f"Running all tests with {num_points} points for high statistical confidence")
+    if verbose:
+        print("Testing simulate_match_points function:")
+        print("=" * 45)
+        print(f"Running all tests with {num_points} points for high statistical confidence")
     
     # Test 1: Elite teams vs Elite teams
-    print("\nTest 1: Elite vs Elite teams")
-    elite_win_pct = simulate_match_points(
+    elite_win_pct = simulate(
         templates["elite_team"],
         templates["elite_team"],
         num_points=num_points
     )
     
-    print(f"Elite vs Elite win percentage: {elite_win_pct * 100:.2f}%")
+    if verbose:
+        print("\nTest 1: Elite vs Elite teams")
+        print(f"Elite vs Elite win percentage: {elite_win_pct * 100:.2f}%")
     assert abs(elite_win_pct - 0.5) < 0.05, f"Expected ~50% win rate for identical teams, got {elite_win_pct * 100:.2f}%"
-    print("✓ Elite teams test passed!")
+    if verbose:
+        print("✓ Elite teams test passed!")
     
     # Test 2: Standard state machine (using default probabilities)
-    print("\nTest 2: Standard state machine with default probabilities")
     from state_definitions import create_beach_volleyball_state_machine
     
     # Create a unified template from the standard state machine
@@ -110,31 +132,235 @@ def test_simulate_match_points() -> None:
             # Convert StateTransitionTuple to the format expected by simulate_match_points
             standard_template[state] = [(next_state, probability) for next_state, probability, _ in transitions]
     
-    standard_win_pct = simulate_match_points(
+    standard_win_pct = simulate(
         standard_template,
         standard_template,
         num_points=num_points
     )
     
-    print(f"Standard vs Standard win percentage: {standard_win_pct * 100:.2f}%")
+    if verbose:
+        print("\nTest 2: Standard state machine with default probabilities")
+        print(f"Standard vs Standard win percentage: {standard_win_pct * 100:.2f}%")
     assert abs(standard_win_pct - 0.5) < 0.05, f"Expected ~50% win rate for identical teams, got {standard_win_pct * 100:.2f}%"
-    print("✓ Standard state machine test passed!")
+    if verbose:
+        print("✓ Standard state machine test passed!")
     
     # Test 3: Elite vs Standard comparison
-    print("\nTest 3: Elite vs Standard teams")
-    elite_vs_standard_pct = simulate_match_points(
+    elite_vs_standard_pct = simulate(
         templates["elite_team"],
         standard_template,
         num_points=num_points
     )
     
-    print(f"Elite vs Standard win percentage: {elite_vs_standard_pct * 100:.2f}%")
-    if elite_vs_standard_pct > 0.50:
-        print("✓ Elite team has higher win rate as expected")
-    else:
-        print(f"! Elite team win rate ({elite_vs_standard_pct * 100:.2f}%) is lower than expected")
+    if verbose:
+        print("\nTest 3: Elite vs Standard teams")
+        print(f"Elite vs Standard win percentage: {elite_vs_standard_pct * 100:.2f}%")
+        if elite_vs_standard_pct > 0.50:
+            print("✓ Elite team has higher win rate as expected")
+        else:
+            print(f"! Elite team win rate ({elite_vs_standard_pct * 100:.2f}%) is lower than expected")
+        
+        print("\nAll match points simulation tests passed!")
+
+
+def test_exact_win_rate() -> None:
+    """Test the exact win rate and elasticities against self-play and simulation.
+    
+    Skipped when numpy or numba is not installed.
+    """
+    try:
+        from elasticity_analysis import (
+            exact_win_rate, calculate_elasticities, create_modified_state_machine,
+            extract_baseline_probabilities
+        )
+    except ImportError:
+        print("numpy/numba not installed, skipping exact win rate test")
+        return
+    from state_machine_builder import create_state_machine_from_teams
+    
+    sm = create_beach_volleyball_state_machine()
+    assert exact_win_rate(sm, sm) == 0.5
+    
+    # Elite vs standard: exactly 0.59219; 20,000 points give a standard error of ~0.0035
+    elite = get_common_state_templates()["elite_team"]
+    standard = {state: [(next_state, probability) for next_state, probability, _ in transitions]
+                for state, transitions in sm.transitions.items() if not sm.is_terminal_state(state)}
+    exact = exact_win_rate(create_state_machine_from_teams(elite, elite), sm)
+    simulated = simulate_match_points(elite, standard, num_points=20000, seed=11)
+    assert abs(exact - 0.59219) < 1e-5, f"Expected exact elite win rate 0.59219, got {exact:.5f}"
+    assert abs(simulated - exact) < 0.015, f"Simulated {simulated:.4f} vs exact {exact:.4f}"
+    
+    # The batched solve must match one exact_win_rate call per stat
+    baseline_probs = extract_baseline_probabilities()
+    stat_names = ["serve_ace_rate", "reception_perfect_rate", "attack_kill_from_good_set"]
+    elasticities = calculate_elasticities(stat_names, baseline_probs, 0.05, out=io.StringIO())
+    for stat_name in stat_names:
+        improved_sm = create_modified_state_machine(baseline_probs, stat_name, 1.05)
+        expected = (exact_win_rate(improved_sm, sm) - 0.5) / (0.5 * 0.05)
+        assert abs(elasticities[stat_name] - expected) < 1e-9, \
+            f"{stat_name}: batched {elasticities[stat_name]} vs single {expected}"
+    
+    print("Exact win rate test passed!")
+
+
+def test_simulate_many_rallies() -> None:
+    """Test the vectorized rally batch against the Python rally simulator.
+    
+    Skipped when numpy or numba is not installed.
+    """
+    try:
+        from rally_simulator_fast import simulate_many_rallies
+    except ImportError:
+        print("numpy/numba not installed, skipping vectorized rally test")
+        return
+    import random
+    
+    sm = create_beach_volleyball_state_machine()
+    
+    # Serving win rates of 50,000 and 20,000 rallies differ by ~0.004 (one standard error)
+    final_ids, _ = simulate_many_rallies(sm, 50000, seed=4)
+    vectorized = sum(sm.winner_by_id[state_id] == "serving" for state_id in final_ids) / 50000
+    rng = random.Random(4)
+    python = sum(simulate_rally_outcome(sm, rng=rng) == "serving" for _ in range(20000)) / 20000
+    assert abs(vectorized - python) < 0.02, f"Vectorized {vectorized:.4f} vs Python {python:.4f}"
+    
+    # Rallies cut off at max_steps keep their last, non-terminal state
+    final_ids, lengths = simulate_many_rallies(sm, 2000, max_steps=3, seed=2)
+    unfinished = [not sm.is_terminal_state(sm.sorted_states[state_id]) for state_id in final_ids]
+    assert any(unfinished), "Expected some rallies to outlast 3 steps"
+    assert all(length == 3 for length, cut in zip(lengths, unfinished) if cut)
+    assert max(lengths) <= 3
+    
+    print("Vectorized rally test passed!")
+
+
+def test_simulate_complete_rally_fast() -> None:
+    """Test that the compiled single rally follows simulate_complete_rally's contract.
+    
+    Skipped when numpy or numba is not installed.
+    """
+    try:
+        from rally_simulator_fast import simulate_complete_rally_fast
+    except ImportError:
+        print("numpy/numba not installed, skipping compiled rally test")
+        return
+    
+    sm = create_beach_volleyball_state_machine()
+    for seed in range(50):
+        rally_sequence, outcome = simulate_complete_rally_fast(sm, seed=seed)
+        assert rally_sequence[0] == sm.initial_state
+        assert sm.is_terminal_state(rally_sequence[-1])
+        assert outcome == f"{get_winning_team(rally_sequence[-1])} team wins"
+        assert simulate_complete_rally_fast(sm, seed=seed) == (rally_sequence, outcome)
+    
+    # Cut-off rallies hold max_steps states, like the Python version
+    for seed in range(50):
+        rally_sequence, outcome = simulate_complete_rally_fast(sm, max_steps=2, seed=seed)
+        assert rally_sequence[0] == sm.initial_state
+        if outcome == "Rally exceeded 2 steps":
+            assert len(rally_sequence) == 2
+        else:
+            assert sm.is_terminal_state(rally_sequence[-1]) and outcome.endswith(" team wins")
     
-    print("\nAll match points simulation tests passed!")
+    print("Compiled rally test passed!")
+
+
+def test_simulate_match_points_vec() -> None:
+    """Test the NumPy-only match simulator against the exact win rate.
+    
+    Skipped when numpy or numba is not installed.
+    """
+    try:
+        from match_simulator_fast import simulate_match_points_vec
+        from elasticity_analysis import exact_win_rate, convert_state_machine_to_template
+    except ImportError:
+        print("numpy/numba not installed, skipping vectorized match test")
+        return
+    from state_machine_builder import create_state_machine_from_teams
+    
+    sm = create_beach_volleyball_state_machine()
+    elite = get_common_state_templates()["elite_team"]
+    standard = convert_state_machine_to_template(sm)
+    
+    # 100,000 points give a standard error of ~0.0016
+    exact = exact_win_rate(create_state_machine_from_teams(elite, elite), sm)
+    simulated = simulate_match_points_vec(elite, standard, num_points=100000, seed=3)
+    assert abs(simulated - exact) < 0.008, f"Vectorized {simulated:.4f} vs exact {exact:.4f}"
+    assert simulate_match_points_vec(elite, standard, num_points=1000, seed=3) == \
+        simulate_match_points_vec(elite, standard, num_points=1000, seed=3)
+    
+    print("Vectorized match test passed!")
+
+
+# Seeded compiled runs, repeated on several Numba threads and then on one;
+# all runs of each simulator must agree, as must common random number pairs
+_THREAD_DETERMINISM_SCRIPT = """
+import numba
+from match_simulator_fast import simulate_match_points_fast
+from match_simulator_fast import simulate_match_points_csr
+from rally_simulator_fast import encode_csr, patch_csr_row, simulate_rallies
+from state_definitions import create_beach_volleyball_state_machine
+from team_templates import get_common_state_templates
+
+team = get_common_state_templates()["elite_team"]
+sm = create_beach_volleyball_state_machine()
+
+def run():
+    return (simulate_match_points_fast(team, team, 300_000, seed=5),
+            simulate_match_points_fast(team, team, 300_000, seed=5, antithetic=True),
+            simulate_rallies(sm, 300_000, seed=3).tobytes())
+
+assert numba.get_num_threads() == 4
+runs = [run(), run()]
+numba.set_num_threads(1)
+runs.append(run())
+assert runs[0] == runs[1] == runs[2], "seeded runs differ"
+
+# Common random numbers: a machine with a rebuilt but unchanged row replays
+# the baseline exactly, point by point
+csr = encode_csr(sm)
+state_id = sm.state_to_idx["r_set_perfect"]
+same_row = patch_csr_row(csr, state_id, [p for _, p, _ in sm.transitions["r_set_perfect"]])
+numba.set_num_threads(4)
+assert (simulate_match_points_csr(same_row, csr, 300_000, seed=7)
+        == simulate_match_points_csr(csr, csr, 300_000, seed=7)), "paired runs differ"
+"""
+
+
+def test_fast_simulators_deterministic_across_threads() -> None:
+    """Test that seeded compiled simulations do not depend on thread scheduling.
+    
+    Runs in a subprocess, since the Numba thread count is fixed at import.
+    Skipped when numba is not installed.
+    """
+    try:
+        import numba  # noqa: F401
+    except ImportError:
+        print("numba not installed, skipping thread determinism test")
+        return
+    
+    # The workqueue layer always starts the requested threads, even on one core
+    env = dict(os.environ, NUMBA_NUM_THREADS="4", NUMBA_THREADING_LAYER="workqueue")
+    subprocess.run([sys.executable, "-c", _THREAD_DETERMINISM_SCRIPT], env=env, check=True,
+                   cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    print("Thread determinism test passed!")
+
+
+def test_default_graph_metrics_snapshot() -> None:
+    """Test that the hard-coded default graph metrics match the default state machine.
+    
+    Skipped when the visualization dependencies are not installed.
+    """
+    try:
+        from utils import interactive_visualization as v
+    except ImportError:
+        print("Visualization dependencies not installed, skipping graph metrics test")
+        return
+    
+    graph = v.create_networkx_graph(create_beach_volleyball_state_machine())
+    assert v.DEFAULT_GRAPH_METRICS == v.get_graph_metrics(graph), \
+        "DEFAULT_GRAPH_METRICS is stale; regenerate it (see utils/interactive_visualization.py)"
+    print("Default graph metrics test passed!")
 
 
 def test_display_functions() -> None:
@@ -155,6 +381,30 @@ def run_comprehensive_tests() -> None:
     test_winning_conditions()
     test_rally_simulation()
     test_simulate_match_points()
+    test_exact_win_rate()
+    test_simulate_many_rallies()
+    test_simulate_complete_rally_fast()
+    test_simulate_match_points_vec()
+    test_fast_simulators_deterministic_across_threads()
+    test_default_graph_metrics_snapshot()
     test_display_functions()
     
     print("\nAll tests completed successfully!")
+
+
+def run_benchmarks(num_points: int = 1_000_000) -> None:
+    """Time the match points checks on the compiled simulator, without printing per test.
+    
+    Needs numpy and numba (see match_simulator_fast.py).
+    """
+    import time
+    from match_simulator_fast import simulate_match_points_fast
+    
+    # Compile (or load from the cache) before timing
+    templates = get_common_state_templates()
+    simulate_match_points_fast(templates["elite_team"], templates["elite_team"], num_points=10)
+    
+    start = time.perf_counter()
+    _run_match_points_assertions(num_points=num_points, simulate=simulate_match_points_fast)
+    elapsed = time.perf_counter() - start
+    print(f"Match points benchmark: 3 x {num_points:,} points in {elapsed:.3f}s")
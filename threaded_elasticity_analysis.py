@@ -1,75 +1,225 @@
 # /// script
 # requires-python = ">=3.9"
-# dependencies = []
+# dependencies = ["numpy", "numba"]
 # ///
-"""Multi-threaded elasticity analysis for beach volleyball state machine statistics."""
+"""Parallel elasticity analysis for beach volleyball state machine statistics.
 
-from typing import Dict, List, Tuple, Any
-from decimal import Decimal
-import copy
+Each stat is simulated in its own worker process with the compiled match
+simulator from match_simulator_fast.py.
+"""
+
+from typing import Dict, List, Mapping, NamedTuple, Optional, Tuple, Any
+from dataclasses import dataclass
 import concurrent.futures
-import threading
+import io
+import math
+import multiprocessing
+import sys
 import time
+import numba
+import numpy as np
 from state_definitions import create_beach_volleyball_state_machine
-from match_simulator import simulate_match_points
-from state_machine_builder import create_state_machine_from_teams
+from match_simulator import build_serving_state_machines
+from match_simulator_fast import simulate_match_points_csr
+from rally_simulator_fast import CSRStateMachine, encode_csr, patch_csr_row
 from elasticity_analysis import (
     extract_baseline_probabilities, 
-    create_modified_state_machine, 
+    improved_row_probabilities, 
     convert_state_machine_to_template
 )
 
-# Thread-safe print lock
-print_lock = threading.Lock()
 
-def thread_safe_print(*args, **kwargs):
-    """Thread-safe printing function."""
-    with print_lock:
-        print(*args, **kwargs)
+class _BaselineMatch(NamedTuple):
+    """Encoded machine of a baseline team serving against a baseline team.
+    
+    Both serving configurations of the baseline matchup share this machine.
+    """
+    csr: CSRStateMachine
+    state_to_idx: Dict[str, int]
+
+
+# Built on first use in the parent and handed to each worker once by
+# _init_worker, not rebuilt per process or per task
+_baseline_match: Optional[_BaselineMatch] = None
+
+
+def _get_baseline_match() -> _BaselineMatch:
+    """Return the encoded baseline matchup, building it on first use."""
+    global _baseline_match
+    if _baseline_match is None:
+        template = convert_state_machine_to_template(create_beach_volleyball_state_machine())
+        serves, _ = build_serving_state_machines(template, template)
+        _baseline_match = _BaselineMatch(encode_csr(serves), serves.state_to_idx)
+    return _baseline_match
+
+
+@dataclass
+class WelfordState:
+    """Running count, mean, variance and range of a stream of values (Welford's algorithm)."""
+    
+    n: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    min: float = math.inf
+    max: float = -math.inf
+    
+    def update(self, x: float) -> None:
+        """Add one value."""
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+    
+    @property
+    def variance(self) -> float:
+        """Population variance of the values seen so far."""
+        return self.m2 / self.n if self.n else 0.0
+
+
+def worker_print(message: str) -> None:
+    """Print a line from a worker process.
+    
+    The line and its newline go out in one flushed write, so lines from
+    concurrent workers do not interleave.
+    """
+    print(message + "\n", end="", flush=True)
+
+
+def _init_worker(num_threads: int, baseline_match: _BaselineMatch) -> None:
+    """Store the parent's baseline matchup and cap the threads of the worker's parallel kernel.
+    
+    The thread cap keeps the pool from oversubscribing the cores.
+    """
+    global _baseline_match
+    _baseline_match = baseline_match
+    numba.set_num_threads(num_threads)
 
 
 def calculate_elasticity_threaded(args):
-    """Thread-safe version of elasticity calculation."""
-    stat_name, baseline_probs, improvement_pct, num_points, thread_id = args
+    """Elasticity calculation for one stat, run in a worker process.
+    
+    Module-level so it can be pickled. args carry only scalars; the
+    baseline matchup comes from _init_worker.
+    """
+    stat_name, baseline_prob, improvement_pct, num_points, thread_id, baseline_win_rate, seed = args
     
-    thread_safe_print(f"[Thread {thread_id}] Analyzing {stat_name}...")
+    worker_print(f"[Worker {thread_id}] Analyzing {stat_name}...")
     start_time = time.time()
     
     try:
-        # Create baseline state machine
-        baseline_sm = create_beach_volleyball_state_machine()
-        baseline_template = convert_state_machine_to_template(baseline_sm)
-        
-        # Simulate baseline win rate
-        baseline_win_rate = simulate_match_points(baseline_template, baseline_template, num_points)
-        
-        # Create improved state machine
-        improvement_factor = 1.0 + improvement_pct
-        improved_sm = create_modified_state_machine(baseline_probs, stat_name, improvement_factor)
-        improved_template = convert_state_machine_to_template(improved_sm)
+        # Patch the stat's row into the baseline encoding; the improved team
+        # owns it when serving for s_ states and when receiving for r_ states
+        baseline = _get_baseline_match()
+        state, probs = improved_row_probabilities(stat_name, 1.0 + improvement_pct)
+        improved_csr = patch_csr_row(baseline.csr, baseline.state_to_idx[state], probs)
+        if state.startswith('s_'):
+            a_csr, b_csr = improved_csr, baseline.csr
+        else:
+            a_csr, b_csr = baseline.csr, improved_csr
         
         # Simulate improved win rate (team with improvement vs baseline team)
-        improved_win_rate = simulate_match_points(improved_template, baseline_template, num_points)
+        # Same seed and points as the baseline run (common random numbers)
+        improved_win_rate = simulate_match_points_csr(a_csr, b_csr, num_points, seed=seed)
         
         # Calculate elasticity
         win_rate_change = improved_win_rate - baseline_win_rate
         elasticity = win_rate_change / (baseline_win_rate * improvement_pct)
         
         elapsed_time = time.time() - start_time
-        thread_safe_print(f"[Thread {thread_id}] {stat_name} completed in {elapsed_time:.1f}s - Elasticity: {elasticity:+.3f}")
-        
-        return stat_name, elasticity, baseline_probs[stat_name]
+        worker_print(f"[Worker {thread_id}] {stat_name} completed in {elapsed_time:.1f}s - Elasticity: {elasticity:+.3f}")
         
+        return stat_name, elasticity, baseline_prob
+    
     except Exception as e:
-        thread_safe_print(f"[Thread {thread_id}] Error calculating elasticity for {stat_name}: {e}")
-        return stat_name, 0.0, baseline_probs.get(stat_name, 0.0)
+        worker_print(f"[Worker {thread_id}] Error calculating elasticity for {stat_name}: {e}")
+        return stat_name, 0.0, baseline_prob
+
+
+# Stats to analyze (trainable skills)
+_STATS_TO_ANALYZE = (
+    "serve_ace_rate",
+    "reception_perfect_rate",
+    "reception_good_rate",
+    "attack_kill_from_perfect_set",
+    "attack_kill_from_good_set",
+    "dig_perfect_rate",
+    "block_kill_rate"
+)
+
+
+def _prepare_trial_args(baseline_probs: Mapping[str, float], improvement_pct: float, num_points: int,
+                        seed: Optional[int], first_worker_id: int = 1) -> List[Tuple[Any, ...]]:
+    """Simulate one trial's baseline and return the worker arguments for each of its stats.
+    
+    The baseline and every improved matchup are simulated with the same seed
+    and number of points, so each point replays the same draws at every
+    step (see simulate_match_points_fast) and the noise largely cancels in
+    the win rate differences. A random seed is
+    chosen if none is given.
+    """
+    if seed is None:
+        seed = int(np.random.SeedSequence().generate_state(1)[0])
+    
+    # Simulate the baseline once for all stats
+    baseline = _get_baseline_match()
+    baseline_win_rate = simulate_match_points_csr(baseline.csr, baseline.csr, num_points, seed=seed)
+    
+    # Filter to only stats we have baseline data for
+    valid_stats = [stat for stat in _STATS_TO_ANALYZE if stat in baseline_probs]
+    return [(stat_name, baseline_probs[stat_name], improvement_pct, num_points, first_worker_id + i,
+             baseline_win_rate, seed)
+            for i, stat_name in enumerate(valid_stats)]
+
+
+def _run_elasticity_jobs(thread_args: List[Tuple[Any, ...]],
+                         max_workers: Optional[int]) -> List[Tuple[str, float, float]]:
+    """Run calculate_elasticity_threaded over thread_args in one process pool.
+    
+    The pool has at most one worker per job. Results are returned in the order of thread_args.
+    """
+    results: List[Optional[Tuple[str, float, float]]] = [None] * len(thread_args)
+    
+    # Share the cores among the workers that will actually be busy; with
+    # fewer jobs than cores, each kernel spreads its points over the spare ones
+    cpu_count = multiprocessing.cpu_count()
+    pool_size = min(max_workers or cpu_count, len(thread_args)) or 1
+    threads_per_worker = max(1, min(cpu_count // pool_size, numba.config.NUMBA_NUM_THREADS))
+    
+    # Spawn rather than fork: forking after the parallel baseline run can
+    # deadlock the children on Numba's thread pool
+    mp_context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=pool_size, mp_context=mp_context,
+                                                initializer=_init_worker,
+                                                initargs=(threads_per_worker, _get_baseline_match())) as executor:
+        # Submit all tasks
+        future_to_job = {executor.submit(calculate_elasticity_threaded, args): job
+                         for job, args in enumerate(thread_args)}
+        
+        # Collect results as they complete
+        for future in concurrent.futures.as_completed(future_to_job):
+            job = future_to_job[future]
+            stat_name, baseline_prob = thread_args[job][:2]
+            try:
+                results[job] = future.result()
+            except Exception as exc:
+                print(f"Error with {stat_name}: {exc}")
+                results[job] = (stat_name, 0.0, baseline_prob)
+    
+    return results
 
 
 def run_threaded_elasticity_analysis(improvement_pct: float = 0.05, num_points: int = 100000, 
-                                    max_workers: int = None) -> List[Tuple[str, float, float]]:
-    """Run elasticity analysis using multiple threads."""
+                                    max_workers: int = None,
+                                    seed: Optional[int] = None) -> List[Tuple[str, float, float]]:
+    """Run elasticity analysis with one worker process per stat (up to max_workers).
+    
+    All stats share one seed with the baseline run (common random numbers);
+    a random seed is chosen if none is given.
+    """
     
-    print("Beach Volleyball Threaded Elasticity Analysis")
+    print("Beach Volleyball Parallel Elasticity Analysis")
     print("=" * 60)
     print(f"Improvement: {improvement_pct*100:.1f}% per stat")
     print(f"Simulation points: {num_points:,} per stat")
@@ -78,135 +228,132 @@ def run_threaded_elasticity_analysis(improvement_pct: float = 0.05, num_points:
     
     # Get baseline probabilities
     baseline_probs = extract_baseline_probabilities()
+    thread_args = _prepare_trial_args(baseline_probs, improvement_pct, num_points, seed)
     
-    # Stats to analyze (trainable skills)
-    stats_to_analyze = [
-        "serve_ace_rate",
-        "reception_perfect_rate", 
-        "reception_good_rate",
-        "attack_kill_from_perfect_set",
-        "attack_kill_from_good_set",
-        "dig_perfect_rate",
-        "block_kill_rate"
-    ]
-    
-    # Filter to only stats we have baseline data for
-    valid_stats = [stat for stat in stats_to_analyze if stat in baseline_probs]
-    
-    print(f"Analyzing {len(valid_stats)} stats in parallel...")
+    print(f"Analyzing {len(thread_args)} stats in parallel...")
     print()
     
-    # Prepare arguments for each thread
-    thread_args = []
-    for i, stat_name in enumerate(valid_stats):
-        thread_args.append((stat_name, baseline_probs, improvement_pct, num_points, i+1))
-    
     # Run analysis in parallel
     start_time = time.time()
-    results = []
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all tasks
-        future_to_stat = {executor.submit(calculate_elasticity_threaded, args): args[0] 
-                         for args in thread_args}
-        
-        # Collect results as they complete
-        for future in concurrent.futures.as_completed(future_to_stat):
-            stat_name = future_to_stat[future]
-            try:
-                result = future.result()
-                results.append(result)
-            except Exception as exc:
-                thread_safe_print(f"Error with {stat_name}: {exc}")
-                results.append((stat_name, 0.0, baseline_probs.get(stat_name, 0.0)))
+    results = _run_elasticity_jobs(thread_args, max_workers)
     
     total_time = time.time() - start_time
     print()
     print(f"All analyses completed in {total_time:.1f} seconds")
     print()
     
+    print_elasticity_report(results)
+    return results
+
+
+def print_elasticity_report(results: List[Tuple[str, float, float]]) -> None:
+    """Print the results summary, training ranking and coaching insights.
+    
+    Sorts results in place by absolute elasticity (highest impact first).
+    The report is built in memory and written to stdout in one go, after
+    the worker pool has shut down.
+    """
+    report = io.StringIO()
+    
     # Sort by elasticity (highest impact first)
     results.sort(key=lambda x: abs(x[1]), reverse=True)
     
     # Display results
-    print("RESULTS SUMMARY")
-    print("=" * 50)
+    print("RESULTS SUMMARY", file=report)
+    print("=" * 50, file=report)
     
     for stat_name, elasticity, baseline_value in results:
-        print(f"{stat_name:30} | Baseline: {baseline_value:6.1%} | Elasticity: {elasticity:+6.3f}")
+        print(f"{stat_name:30} | Baseline: {baseline_value:6.1%} | Elasticity: {elasticity:+6.3f}", file=report)
     
-    print("\n" + "=" * 50)
-    print("TRAINING PRIORITY RANKING")
-    print("=" * 50)
+    print("\n" + "=" * 50, file=report)
+    print("TRAINING PRIORITY RANKING", file=report)
+    print("=" * 50, file=report)
     
     for i, (stat_name, elasticity, baseline) in enumerate(results, 1):
         impact_desc = "High Impact" if abs(elasticity) > 1.0 else "Medium Impact" if abs(elasticity) > 0.5 else "Low Impact"
-        print(f"{i}. {stat_name:25} | {elasticity:+6.3f} | {impact_desc}")
+        print(f"{i}. {stat_name:25} | {elasticity:+6.3f} | {impact_desc}", file=report)
     
-    print(f"\nInterpretation: Elasticity shows how much win rate changes per 1% stat improvement")
-    print(f"Example: Elasticity of +2.0 means 1% stat improvement → +2% win rate improvement")
+    print(f"\nInterpretation: Elasticity shows how much win rate changes per 1% stat improvement", file=report)
+    print(f"Example: Elasticity of +2.0 means 1% stat improvement → +2% win rate improvement", file=report)
     
     # Training insights
-    print("\n" + "=" * 50)
-    print("TRAINING INSIGHTS FOR COACHES")
-    print("=" * 50)
+    print("\n" + "=" * 50, file=report)
+    print("TRAINING INSIGHTS FOR COACHES", file=report)
+    print("=" * 50, file=report)
     
     positive_impacts = [(name, elast, base) for name, elast, base in results if elast > 0]
     negative_impacts = [(name, elast, base) for name, elast, base in results if elast < 0]
     
     if positive_impacts:
-        print("🟢 SKILLS TO IMPROVE (Positive Impact):")
+        print("🟢 SKILLS TO IMPROVE (Positive Impact):", file=report)
         for name, elasticity, baseline in positive_impacts:
             readable_name = name.replace("_", " ").title()
-            print(f"   {readable_name}: {elasticity:+.3f} elasticity")
+            print(f"   {readable_name}: {elasticity:+.3f} elasticity", file=report)
             
             # Calculate practical examples
             example_improvement = baseline * 0.10  # 10% relative improvement
             win_rate_change = elasticity * 0.10 * 50  # Assuming 50% baseline win rate
-            print(f"   → Improving from {baseline:.1%} to {baseline + example_improvement:.1%} = {win_rate_change:+.1f}% win rate change")
-            print()
+            print(f"   → Improving from {baseline:.1%} to {baseline + example_improvement:.1%} = {win_rate_change:+.1f}% win rate change", file=report)
+            print(file=report)
     
     if negative_impacts:
-        print("🔴 UNEXPECTED NEGATIVE IMPACTS:")
+        print("🔴 UNEXPECTED NEGATIVE IMPACTS:", file=report)
         for name, elasticity, baseline in negative_impacts:
             readable_name = name.replace("_", " ").title()
-            print(f"   {readable_name}: {elasticity:+.3f} elasticity")
-            print(f"   → This suggests improving this stat alone may hurt win rate")
-            print(f"   → Likely due to opportunity cost or system interactions")
-            print()
+            print(f"   {readable_name}: {elasticity:+.3f} elasticity", file=report)
+            print(f"   → This suggests improving this stat alone may hurt win rate", file=report)
+            print(f"   → Likely due to opportunity cost or system interactions", file=report)
+            print(file=report)
     
     # Top recommendation
     if results:
         top_stat = results[0]
-        print("🎯 TOP TRAINING PRIORITY:")
+        print("🎯 TOP TRAINING PRIORITY:", file=report)
         readable_name = top_stat[0].replace("_", " ").title()
-        print(f"   Focus on: {readable_name}")
-        print(f"   Impact: {abs(top_stat[1]):.3f} elasticity")
+        print(f"   Focus on: {readable_name}", file=report)
+        print(f"   Impact: {abs(top_stat[1]):.3f} elasticity", file=report)
         if top_stat[1] > 0:
-            print(f"   Strategy: Increase this skill for direct win rate improvement")
+            print(f"   Strategy: Increase this skill for direct win rate improvement", file=report)
         else:
-            print(f"   Strategy: This has highest impact but negative - investigate why")
+            print(f"   Strategy: This has highest impact but negative - investigate why", file=report)
     
-    return results
+    sys.stdout.write(report.getvalue())
 
 
 def run_multiple_threaded_trials(num_trials: int = 3, improvement_pct: float = 0.05, 
                                 num_points: int = 100000, max_workers: int = None):
-    """Run multiple trials to assess consistency with threading."""
+    """Run multiple trials to assess consistency, all stat jobs in one worker pool."""
     print("MULTI-TRIAL CONSISTENCY ANALYSIS (THREADED)")
     print("=" * 60)
     print(f"Running {num_trials} trials with {num_points:,} points each")
-    print(f"Each trial uses threading for parallel stat analysis")
+    print("All trials' stats run as one pool of parallel worker processes")
     print()
     
-    all_results = []
+    baseline_probs = extract_baseline_probabilities()
     total_start_time = time.time()
     
+    # One job per (trial, stat), each trial with its own seed and baseline
+    trial_args = []
     for trial in range(num_trials):
+        trial_args.append(_prepare_trial_args(baseline_probs, improvement_pct, num_points, None,
+                                              first_worker_id=sum(map(len, trial_args)) + 1))
+    
+    thread_args = [job for args in trial_args for job in args]
+    all_results = _run_elasticity_jobs(thread_args, max_workers)
+    print()
+    
+    # Per-stat running statistics, updated trial by trial
+    stats_acc: Dict[str, WelfordState] = {}
+    offset = 0
+    for trial, args in enumerate(trial_args):
+        trial_results = all_results[offset:offset + len(args)]
+        offset += len(args)
+        
         print(f"TRIAL {trial + 1}")
         print("-" * 30)
-        trial_results = run_threaded_elasticity_analysis(improvement_pct, num_points, max_workers)
-        all_results.append(trial_results)
+        print_elasticity_report(trial_results)
+        for name, elast, _ in trial_results:
+            stats_acc.setdefault(name, WelfordState()).update(elast)
         print("\n")
     
     total_time = time.time() - total_start_time
@@ -214,45 +361,32 @@ def run_multiple_threaded_trials(num_trials: int = 3, improvement_pct: float = 0
     print()
     
     # Analyze consistency across trials
-    print("CONSISTENCY ANALYSIS ACROSS TRIALS")
-    print("=" * 40)
+    report = io.StringIO()
+    print("CONSISTENCY ANALYSIS ACROSS TRIALS", file=report)
+    print("=" * 40, file=report)
     
-    if len(all_results) > 1:
-        # Get all stat names
-        stat_names = [stat for stat, _, _ in all_results[0]]
+    if num_trials > 1:
+        print(f"{'Stat Name':25} | {'Mean':>6} | {'StdDev':>6} | {'Range':>6} | {'Min':>6} | {'Max':>6}", file=report)
+        print("-" * 75, file=report)
         
-        print(f"{'Stat Name':25} | {'Mean':>6} | {'StdDev':>6} | {'Range':>6} | {'Min':>6} | {'Max':>6}")
-        print("-" * 75)
-        
-        for stat_name in stat_names:
-            elasticities = []
-            for trial_results in all_results:
-                for name, elast, _ in trial_results:
-                    if name == stat_name:
-                        elasticities.append(elast)
-                        break
-            
-            if elasticities and len(elasticities) > 1:
-                mean_elast = sum(elasticities) / len(elasticities)
-                variance = sum((x - mean_elast) ** 2 for x in elasticities) / len(elasticities)
-                std_dev = variance ** 0.5
-                min_elast = min(elasticities)
-                max_elast = max(elasticities)
-                range_elast = max_elast - min_elast
+        for stat_name, acc in stats_acc.items():
+            if acc.n > 1:
+                std_dev = acc.variance ** 0.5
+                range_elast = acc.max - acc.min
                 
-                print(f"{stat_name:25} | {mean_elast:+6.3f} | {std_dev:6.3f} | {range_elast:6.3f} | {min_elast:+6.3f} | {max_elast:+6.3f}")
+                print(f"{stat_name:25} | {acc.mean:+6.3f} | {std_dev:6.3f} | {range_elast:6.3f} | {acc.min:+6.3f} | {acc.max:+6.3f}", file=report)
             else:
-                print(f"{stat_name:25} | {'N/A':>6} | {'N/A':>6} | {'N/A':>6} | {'N/A':>6} | {'N/A':>6}")
+                print(f"{stat_name:25} | {'N/A':>6} | {'N/A':>6} | {'N/A':>6} | {'N/A':>6} | {'N/A':>6}", file=report)
         
-        print()
-        print("Interpretation:")
-        print("- Low StdDev/Range = More reliable metric")
-        print("- High StdDev/Range = Results vary significantly between runs")
+        print(file=report)
+        print("Interpretation:", file=report)
+        print("- Low StdDev/Range = More reliable metric", file=report)
+        print("- High StdDev/Range = Results vary significantly between runs", file=report)
+    
+    sys.stdout.write(report.getvalue())
 
 
 if __name__ == "__main__":
-    import multiprocessing
-    
     # Get optimal number of workers (number of CPU cores)
     optimal_workers = multiprocessing.cpu_count()
     print(f"Detected {optimal_workers} CPU cores")
@@ -4,26 +4,29 @@
 # ///
 """Core types and constants for the beach volleyball state machine."""
 
-from typing import Dict, List, Tuple, Optional, Set
-from decimal import Decimal
+from typing import Dict, Sequence, Tuple, Optional, Set
 from dataclasses import dataclass
-from enum import Enum
+from enum import IntEnum
 
 
-class ActionType(str, Enum):
-    """Types of actions that can occur in a rally."""
+class ActionType(IntEnum):
+    """Types of actions that can occur in a rally.
     
-    SERVE = "serve"
-    RECEPTION = "reception"
-    SET = "set"
-    ATTACK = "attack"
-    DIG = "dig"
-    BLOCK = "block"
-    TRANSITION = "transition"
+    Values are small consecutive ints so they can index arrays; render a
+    member with action.name.lower() (e.g. "serve").
+    """
+    
+    SERVE = 0
+    RECEPTION = 1
+    SET = 2
+    ATTACK = 3
+    DIG = 4
+    BLOCK = 5
+    TRANSITION = 6
 
 
 # Type alias for state transition tuple
-StateTransitionTuple = Tuple[str, Decimal, ActionType]
+StateTransitionTuple = Tuple[str, float, ActionType]
 
 # Type alias for probability transitions
-ProbabilityTransitions = Dict[str, List[Tuple[str, Decimal]]]
+ProbabilityTransitions = Dict[str, Sequence[Tuple[str, float]]]
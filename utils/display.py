@@ -20,11 +20,11 @@ def print_state_machine_summary(state_machine: RallyStateMachine) -> None:
     print(f"Probability validation: {state_machine.validate_probabilities()}")
     
     print(f"\nTerminal states:")
-    for state in sorted(state_machine.terminal_states):
+    for state in state_machine.sorted_terminal_states:
         winner = get_winning_team(state)
         print(f"  {state} -> {winner} team wins")
     
     print(f"\nSample transitions from initial state:")
     initial_transitions = state_machine.get_next_states(state_machine.initial_state)
     for next_state, probability, action_type in initial_transitions:
-        print(f"  {state_machine.initial_state} -> {next_state} (p={probability}, {action_type})")
+        print(f"  {state_machine.initial_state} -> {next_state} (p={probability}, {action_type.name.lower()})")
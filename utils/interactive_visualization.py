@@ -1,55 +1,210 @@
 # /// script
 # requires-python = ">=3.9"
-# dependencies = ["networkx", "matplotlib", "plotly"]
+# dependencies = ["networkx", "matplotlib", "plotly", "numpy", "scipy"]
 # ///
 """Interactive visualization using NetworkX and Plotly."""
 
 import networkx as nx
+import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
 import plotly.graph_objects as go
 import plotly.express as px
+import json
 import sys
 import os
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from scipy.optimize import minimize
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from state_definitions import create_beach_volleyball_state_machine
 from state_machine import RallyStateMachine
 
 
+# On-disk cache for node positions, shared by every renderer
+POSITIONS_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                    "state_machine_positions.json")
+
+# Identify the layout algorithm in the on-disk cache so stale layouts are recomputed
+_DOT_LAYOUT_NAME = "graphviz-dot-v1"
+_ENERGY_LAYOUT_NAME = "lbfgs-energy-v1"
+
+# Hierarchical 'dot' layouts need pygraphviz and the Graphviz binaries
+try:
+    import pygraphviz  # noqa: F401
+    _HAVE_PYGRAPHVIZ = True
+except ImportError:
+    _HAVE_PYGRAPHVIZ = False
+
+# Graph key -> node positions computed in this process
+_positions_cache: Dict[Tuple[frozenset, frozenset], Dict[str, Tuple[float, float]]] = {}
+
+
+def energy_layout(G: nx.DiGraph, edge_length: float = 1.0, k: float = 1.0,
+                  seed: int = 0, maxiter: int = 50) -> Dict[str, Tuple[float, float]]:
+    """Force-directed layout by direct L-BFGS minimization of a spring energy.
+    
+    Minimizes sum over edges of (|x_i - x_j| - edge_length)^2 plus sum over
+    node pairs of k^2 / |x_i - x_j|, with the analytical gradient, and
+    rescales the result to [-1, 1] like nx.spring_layout.
+    """
+    nodes = list(G.nodes)
+    n = len(nodes)
+    if n <= 1:
+        return {node: (0.0, 0.0) for node in nodes}
+    
+    # Undirected edge endpoints from the symmetrized sparse adjacency
+    adjacency = nx.to_scipy_sparse_array(G, nodelist=nodes, weight=None)
+    adjacency = ((adjacency + adjacency.T) > 0).tocoo()
+    upper = adjacency.row < adjacency.col
+    edge_i, edge_j = adjacency.row[upper], adjacency.col[upper]
+    pair_i, pair_j = np.triu_indices(n, 1)
+    
+    def energy(flat: np.ndarray) -> Tuple[float, np.ndarray]:
+        x = flat.reshape(n, 2)
+        grad = np.zeros_like(x)
+        
+        # Attraction: springs of rest length edge_length along edges
+        diff = x[edge_i] - x[edge_j]
+        dist = np.maximum(np.linalg.norm(diff, axis=1), 1e-9)
+        stretch = dist - edge_length
+        force = (2.0 * stretch / dist)[:, None] * diff
+        np.add.at(grad, edge_i, force)
+        np.add.at(grad, edge_j, -force)
+        
+        # Repulsion: k^2 / distance between every pair of nodes
+        diff = x[pair_i] - x[pair_j]
+        dist = np.maximum(np.linalg.norm(diff, axis=1), 1e-9)
+        force = (-k * k / dist ** 3)[:, None] * diff
+        np.add.at(grad, pair_i, force)
+        np.add.at(grad, pair_j, -force)
+        
+        total = float(np.sum(stretch ** 2) + np.sum(k * k / dist))
+        return total, grad.ravel()
+    
+    initial = np.random.default_rng(seed).uniform(-1.0, 1.0, size=2 * n) * np.sqrt(n)
+    result = minimize(energy, initial, jac=True, method='L-BFGS-B', options={'maxiter': maxiter})
+    
+    coords = nx.rescale_layout(result.x.reshape(n, 2))
+    return {node: (float(x), float(y)) for node, (x, y) in zip(nodes, coords)}
+
+
+def _graph_key(G: nx.DiGraph) -> Tuple[frozenset, frozenset]:
+    """Cache key identifying a graph by its node and edge sets."""
+    return (frozenset(G.nodes), frozenset(G.edges))
+
+
+def dot_layout(G: nx.DiGraph) -> Dict[str, Tuple[float, float]]:
+    """Hierarchical Graphviz 'dot' layout, rescaled to [-1, 1] like the other layouts."""
+    layout = nx.nx_agraph.graphviz_layout(G, prog='dot')
+    nodes = list(layout)
+    coords = nx.rescale_layout(np.array([layout[node] for node in nodes], dtype=float))
+    return {node: (float(x), float(y)) for node, (x, y) in zip(nodes, coords)}
+
+
+def _compute_layout(G: nx.DiGraph) -> Tuple[str, Dict[str, Tuple[float, float]]]:
+    """Lay out G with 'dot' when Graphviz is available, else with energy_layout."""
+    if _HAVE_PYGRAPHVIZ:
+        try:
+            return _DOT_LAYOUT_NAME, dot_layout(G)
+        except (ImportError, OSError, ValueError) as e:
+            print(f"Graphviz layout unavailable ({e}), using energy layout")
+    return _ENERGY_LAYOUT_NAME, energy_layout(G)
+
+
+def _get_cached_positions(G: nx.DiGraph) -> Dict[str, Tuple[float, float]]:
+    """Return a deterministic layout for G, computing it at most once.
+    
+    Positions are looked up in memory, then in POSITIONS_CACHE_FILE (used
+    only if it was saved by the preferred layout for the same nodes and
+    edges), and computed with _compute_layout otherwise. An unreadable
+    cache file counts as a miss and a failed write is ignored.
+    """
+    key = _graph_key(G)
+    if key in _positions_cache:
+        return _positions_cache[key]
+    
+    preferred_name = _DOT_LAYOUT_NAME if _HAVE_PYGRAPHVIZ else _ENERGY_LAYOUT_NAME
+    pos = None
+    try:
+        with open(POSITIONS_CACHE_FILE) as f:
+            cached = json.load(f)
+        cached_key = (frozenset(cached["nodes"]), frozenset(map(tuple, cached["edges"])))
+        if cached["layout"] == preferred_name and cached_key == key:
+            pos = {node: (float(x), float(y)) for node, (x, y) in cached["positions"].items()}
+    except (OSError, ValueError, TypeError, KeyError, AttributeError):
+        pos = None
+    
+    if pos is None:
+        layout_name, pos = _compute_layout(G)
+        cached = {
+            "layout": layout_name,
+            "nodes": sorted(key[0]),
+            "edges": sorted(key[1]),
+            "positions": pos,
+        }
+        try:
+            with open(POSITIONS_CACHE_FILE, 'w') as f:
+                json.dump(cached, f)
+        except OSError:
+            pass
+    
+    _positions_cache[key] = pos
+    return pos
+
+
 def create_networkx_graph(sm: RallyStateMachine) -> nx.DiGraph:
-    """Create a NetworkX directed graph from the state machine."""
-    G = nx.DiGraph()
+    """Create a NetworkX directed graph from the state machine.
+    
+    The terminal state set is attached as G.graph['terminal'] so renderers
+    can test membership without going back to the state machine.
+    """
+    terminal = frozenset(sm.terminal_states)
+    G = nx.DiGraph(terminal=terminal)
     
     # Add nodes with attributes
-    for state in sm.get_all_states():
-        node_type = 'terminal' if sm.is_terminal_state(state) else 'continuation'
-        team = 'serving' if state.startswith('s_') else 'receiving' if state.startswith('r_') else 'neutral'
-        G.add_node(state, type=node_type, team=team)
+    G.add_nodes_from(
+        (state, {
+            'type': 'terminal' if state in terminal else 'continuation',
+            'team': 'serving' if state.startswith('s_') else 'receiving' if state.startswith('r_') else 'neutral'
+        })
+        for state in sm.get_all_states()
+    )
     
     # Add edges with probabilities
-    for state, transitions in sm.transitions.items():
-        for next_state, probability, action_type in transitions:
-            G.add_edge(state, next_state, 
-                      probability=float(probability), 
-                      action=action_type.value,
-                      weight=float(probability))
+    G.add_edges_from(
+        (state, next_state, {
+            'probability': probability,
+            'action': action_type.name.lower(),
+            'weight': probability
+        })
+        for state, transitions in sm.transitions.items()
+        for next_state, probability, action_type in transitions
+    )
     
     return G
 
 
-def plot_matplotlib_graph(sm: RallyStateMachine, filename: str = "state_machine_matplotlib.png") -> None:
-    """Create a matplotlib visualization."""
-    G = create_networkx_graph(sm)
+def plot_matplotlib_graph(sm: RallyStateMachine, filename: str = "state_machine_matplotlib.png",
+                          G: Optional[nx.DiGraph] = None,
+                          pos: Optional[Dict[str, Tuple[float, float]]] = None) -> None:
+    """Create a matplotlib visualization.
     
-    plt.figure(figsize=(20, 16))
+    G and pos may be passed in to reuse a graph and layout across renderers.
+    """
+    if G is None:
+        G = create_networkx_graph(sm)
     
-    # Use spring layout for better visualization
-    pos = nx.spring_layout(G, k=3, iterations=50)
+    fig, ax = plt.subplots(figsize=(20, 16))
+    
+    if pos is None:
+        pos = _get_cached_positions(G)
     
     # Color nodes by type and team
+    terminal = G.graph['terminal']
     node_colors = []
     for node in G.nodes():
-        if sm.is_terminal_state(node):
+        if node in terminal:
             node_colors.append('red')
         elif node.startswith('s_'):
             node_colors.append('lightblue')
@@ -58,23 +213,27 @@ def plot_matplotlib_graph(sm: RallyStateMachine, filename: str = "state_machine_
         else:
             node_colors.append('gray')
     
-    # Draw the graph
-    nx.draw(G, pos, 
-            node_color=node_colors,
-            node_size=1000,
-            font_size=8,
-            font_weight='bold',
-            arrows=True,
-            arrowsize=20,
-            edge_color='gray',
-            alpha=0.7)
+    # All edges as one LineCollection, with one quiver call marking direction
+    # at each edge midpoint, instead of a FancyArrowPatch per edge
+    segments = np.array([[pos[u], pos[v]] for u, v in G.edges()])
+    ax.add_collection(LineCollection(segments, colors='gray', linewidths=1, alpha=0.7))
+    midpoints = segments.mean(axis=1)
+    directions = segments[:, 1] - segments[:, 0]
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    ax.quiver(midpoints[:, 0], midpoints[:, 1], directions[:, 0], directions[:, 1],
+              color='gray', alpha=0.7, angles='xy', pivot='mid',
+              scale_units='xy', scale=25, width=0.002, headwidth=6, headlength=8)
+    
+    coords = np.array([pos[node] for node in G.nodes()])
+    ax.scatter(coords[:, 0], coords[:, 1], c=node_colors, s=1000, alpha=0.7, zorder=2)
+    ax.set_axis_off()
     
     # Add edge labels for probabilities
     edge_labels = {}
     for u, v, data in G.edges(data=True):
         edge_labels[(u, v)] = f"{data['probability']:.2f}"
     
-    nx.draw_networkx_edge_labels(G, pos, edge_labels, font_size=6)
+    nx.draw_networkx_edge_labels(G, pos, edge_labels, font_size=6, ax=ax)
     
     plt.title("Beach Volleyball State Machine", size=16)
     plt.tight_layout()
@@ -83,48 +242,42 @@ def plot_matplotlib_graph(sm: RallyStateMachine, filename: str = "state_machine_
     print(f"Matplotlib graph saved as {filename}")
 
 
-def create_interactive_plotly(sm: RallyStateMachine, filename: str = "interactive_state_machine.html") -> None:
-    """Create an interactive Plotly visualization."""
-    G = create_networkx_graph(sm)
+def create_interactive_plotly(sm: RallyStateMachine, filename: str = "interactive_state_machine.html",
+                              G: Optional[nx.DiGraph] = None,
+                              pos: Optional[Dict[str, Tuple[float, float]]] = None) -> None:
+    """Create an interactive Plotly visualization.
     
-    # Use spring layout
-    pos = nx.spring_layout(G, k=2, iterations=50)
+    G and pos may be passed in to reuse a graph and layout across renderers.
+    """
+    if G is None:
+        G = create_networkx_graph(sm)
     
-    # Prepare node trace
-    node_x = []
-    node_y = []
-    node_text = []
-    node_colors = []
+    if pos is None:
+        pos = _get_cached_positions(G)
     
-    for node in G.nodes():
-        x, y = pos[node]
-        node_x.append(x)
-        node_y.append(y)
-        node_text.append(node)
-        
-        if sm.is_terminal_state(node):
-            node_colors.append(0)  # Red for terminal
-        elif node.startswith('s_'):
-            node_colors.append(1)  # Blue for serving team
-        elif node.startswith('r_'):
-            node_colors.append(2)  # Green for receiving team
-        else:
-            node_colors.append(3)  # Gray for other
-    
-    # Prepare edge traces
-    edge_x = []
-    edge_y = []
-    edge_info = []
-    
-    for edge in G.edges():
-        x0, y0 = pos[edge[0]]
-        x1, y1 = pos[edge[1]]
-        edge_x.extend([x0, x1, None])
-        edge_y.extend([y0, y1, None])
-        
-        prob = G[edge[0]][edge[1]]['probability']
-        action = G[edge[0]][edge[1]]['action']
-        edge_info.append(f"{edge[0]} → {edge[1]}<br>Probability: {prob:.1%}<br>Action: {action}")
+    # Prepare node trace from contiguous arrays
+    nodes = list(G.nodes())
+    coords = np.fromiter((c for node in nodes for c in pos[node]),
+                         dtype=float, count=2 * len(nodes)).reshape(-1, 2)
+    node_x, node_y = coords[:, 0], coords[:, 1]
+    node_text = nodes
+    
+    # Color codes: 0 red terminal, 1 blue serving, 2 green receiving, 3 gray other
+    names = np.array(nodes)
+    node_colors = np.select(
+        [np.isin(names, list(G.graph['terminal'])),
+         np.char.startswith(names, 's_'),
+         np.char.startswith(names, 'r_')],
+        [0, 1, 2], default=3)
+    
+    # Prepare edge traces: (source, target, NaN) triples, NaN breaks the line
+    edges = list(G.edges())
+    src = np.array([pos[u] for u, _ in edges]).reshape(-1, 2)
+    dst = np.array([pos[v] for _, v in edges]).reshape(-1, 2)
+    edge_x = np.empty(3 * len(edges))
+    edge_y = np.empty(3 * len(edges))
+    edge_x[0::3], edge_x[1::3], edge_x[2::3] = src[:, 0], dst[:, 0], np.nan
+    edge_y[0::3], edge_y[1::3], edge_y[2::3] = src[:, 1], dst[:, 1], np.nan
     
     # Create edge trace
     edge_trace = go.Scatter(x=edge_x, y=edge_y,
@@ -167,28 +320,81 @@ def create_interactive_plotly(sm: RallyStateMachine, filename: str = "interactiv
     print("Open in browser to explore the state machine interactively!")
 
 
-def analyze_graph_metrics(sm: RallyStateMachine) -> None:
+class GraphMetrics(NamedTuple):
+    """Graph-theoretic properties printed by analyze_graph_metrics."""
+    num_nodes: int
+    num_edges: int
+    density: float
+    is_dag: bool
+    top_in_degree: List[Tuple[str, float]]
+    top_out_degree: List[Tuple[str, float]]
+
+
+# Graph key -> metrics computed in this process
+_metrics_cache: Dict[Tuple[frozenset, frozenset], GraphMetrics] = {}
+
+
+# Metrics of the default state machine's graph, which is fixed by
+# state_definitions.py (checked by tests/test_functions.py). Regenerate after
+# editing the default machine by running, from the repository root:
+#   python -c "from utils import interactive_visualization as v; print(v.get_graph_metrics(
+#       v.create_networkx_graph(v.create_beach_volleyball_state_machine())))"
+DEFAULT_GRAPH_METRICS = GraphMetrics(
+    num_nodes=33,
+    num_edges=65,
+    density=0.061553030303030304,
+    is_dag=False,
+    top_in_degree=[('r_set_error', 0.125), ('r_set_good', 0.125), ('r_set_perfect', 0.125),
+                   ('r_attack_blocked', 0.09375), ('r_attack_defended', 0.09375)],
+    top_out_degree=[('r_attack_blocked', 0.125), ('r_dig_good', 0.125), ('r_reception_good', 0.125),
+                    ('r_set_good', 0.125), ('r_set_perfect', 0.125)]
+)
+
+
+def get_graph_metrics(G: nx.DiGraph, top: int = 5) -> GraphMetrics:
+    """Compute graph metrics for G, reusing earlier results for the same graph."""
+    key = _graph_key(G)
+    if key not in _metrics_cache:
+        in_centrality = nx.in_degree_centrality(G)
+        out_centrality = nx.out_degree_centrality(G)
+        _metrics_cache[key] = GraphMetrics(
+            num_nodes=G.number_of_nodes(),
+            num_edges=G.number_of_edges(),
+            density=nx.density(G),
+            is_dag=nx.is_directed_acyclic_graph(G),
+            # Ties broken by state name so the ranking is reproducible
+            top_in_degree=sorted(in_centrality.items(), key=lambda x: (-x[1], x[0]))[:top],
+            top_out_degree=sorted(out_centrality.items(), key=lambda x: (-x[1], x[0]))[:top]
+        )
+    return _metrics_cache[key]
+
+
+def analyze_graph_metrics(sm: RallyStateMachine, G: Optional[nx.DiGraph] = None) -> None:
     """Analyze graph-theoretic properties of the state machine."""
-    G = create_networkx_graph(sm)
+    if G is None and sm is create_beach_volleyball_state_machine():
+        # The shared default machine's metrics are known ahead of time
+        metrics = DEFAULT_GRAPH_METRICS
+    else:
+        if G is None:
+            G = create_networkx_graph(sm)
+        metrics = get_graph_metrics(G)
     
     print("Graph Analysis:")
     print("=" * 40)
-    print(f"Nodes: {G.number_of_nodes()}")
-    print(f"Edges: {G.number_of_edges()}")
-    print(f"Density: {nx.density(G):.3f}")
-    print(f"Is DAG (Directed Acyclic Graph): {nx.is_directed_acyclic_graph(G)}")
+    print(f"Nodes: {metrics.num_nodes}")
+    print(f"Edges: {metrics.num_edges}")
+    print(f"Density: {metrics.density:.3f}")
+    print(f"Is DAG (Directed Acyclic Graph): {metrics.is_dag}")
     
-    # Calculate centrality measures
+    # Centrality measures
     print("\nCentrality Analysis (Top 5 nodes):")
-    in_centrality = nx.in_degree_centrality(G)
-    out_centrality = nx.out_degree_centrality(G)
     
     print("Highest in-degree (most reached states):")
-    for state, centrality in sorted(in_centrality.items(), key=lambda x: x[1], reverse=True)[:5]:
+    for state, centrality in metrics.top_in_degree:
         print(f"  {state}: {centrality:.3f}")
     
     print("Highest out-degree (most branching states):")
-    for state, centrality in sorted(out_centrality.items(), key=lambda x: x[1], reverse=True)[:5]:
+    for state, centrality in metrics.top_out_degree:
         print(f"  {state}: {centrality:.3f}")
 
 
@@ -205,14 +411,17 @@ if __name__ == "__main__":
     
     sm = create_beach_volleyball_state_machine()
     
-    if args.all or not any([args.matplotlib, args.plotly, args.analyze]):
-        plot_matplotlib_graph(sm)
-        create_interactive_plotly(sm)
+    make_all = args.all or not any([args.matplotlib, args.plotly, args.analyze])
+    
+    if make_all or args.matplotlib or args.plotly:
+        # Build the graph and its layout once and share them across renderers
+        G = create_networkx_graph(sm)
+        pos = _get_cached_positions(G)
+        if make_all or args.matplotlib:
+            plot_matplotlib_graph(sm, G=G, pos=pos)
+        if make_all or args.plotly:
+            create_interactive_plotly(sm, G=G, pos=pos)
+    
+    # The default machine's metrics are precomputed, no graph needed
+    if make_all or args.analyze:
         analyze_graph_metrics(sm)
-    else:
-        if args.matplotlib:
-            plot_matplotlib_graph(sm)
-        if args.plotly:
-            create_interactive_plotly(sm)
-        if args.analyze:
-            analyze_graph_metrics(sm)
\ No newline at end of file
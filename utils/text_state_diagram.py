@@ -8,7 +8,7 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from state_definitions import create_beach_volleyball_state_machine
+from state_definitions import create_beach_volleyball_state_machine, WINNER_OF, TERMINAL_INFO
 
 
 def print_state_flow_diagram():
@@ -37,13 +37,12 @@ def print_state_flow_diagram():
             if state in sm.transitions:
                 transitions = sm.get_next_states(state)
                 print(f"\n  {state}:")
-                for next_state, prob, action in transitions:
-                    arrow = "  ├─→" if transitions.index((next_state, prob, action)) < len(transitions) - 1 else "  └─→"
+                for i, (next_state, prob, action) in enumerate(transitions):
+                    arrow = "  ├─→" if i < len(transitions) - 1 else "  └─→"
                     terminal = " [TERMINAL]" if sm.is_terminal_state(next_state) else ""
                     print(f"{arrow} {next_state} ({prob:.1%}){terminal}")
             elif state in sm.terminal_states:
-                from state_definitions import get_winning_team
-                winner = get_winning_team(state)
+                winner = WINNER_OF[state]
                 print(f"\n  {state}: [TERMINAL - {winner} team wins]")
 
 
@@ -69,7 +68,7 @@ def print_probability_summary():
             transitions = sm.get_next_states(state)
             for next_state, prob, action in transitions:
                 outcome = next_state.split('_')[-1].upper()
-                print(f"  {outcome:12} {prob:6.1%}  {'█' * int(float(prob) * 20)}")
+                print(f"  {outcome:12} {prob:6.1%}  {'█' * int(prob * 20)}")
 
 
 def print_terminal_analysis():
@@ -82,9 +81,8 @@ def print_terminal_analysis():
     serving_wins = []
     receiving_wins = []
     
-    for terminal_state in sorted(sm.terminal_states):
-        from state_definitions import get_winning_team
-        winner = get_winning_team(terminal_state)
+    for terminal_state in sm.sorted_terminal_states:
+        winner = WINNER_OF[terminal_state]
         if winner == 'serving':
             serving_wins.append(terminal_state)
         else:
@@ -92,14 +90,12 @@ def print_terminal_analysis():
     
     print(f"\nSERVING TEAM WINS ({len(serving_wins)} ways):")
     for state in serving_wins:
-        action = state.split('_')[1] if len(state.split('_')) > 1 else 'unknown'
-        team_prefix = 'OWN' if state.startswith('s_') else 'OPP'
+        team_prefix, action = TERMINAL_INFO[state]
         print(f"  {state:20} - {team_prefix} {action.upper()}")
     
     print(f"\nRECEIVING TEAM WINS ({len(receiving_wins)} ways):")
     for state in receiving_wins:
-        action = state.split('_')[1] if len(state.split('_')) > 1 else 'unknown'
-        team_prefix = 'OWN' if state.startswith('r_') else 'OPP'
+        team_prefix, action = TERMINAL_INFO[state]
         print(f"  {state:20} - {team_prefix} {action.upper()}")
     
     print(f"\nBalance: {len(serving_wins)} vs {len(receiving_wins)} terminal states")
@@ -4,102 +4,105 @@
 # ///
 """Visualization tools for the beach volleyball state machine."""
 
+from typing import Sequence
 import graphviz
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from state_definitions import create_beach_volleyball_state_machine
+from state_definitions import create_beach_volleyball_state_machine, WINNER_OF
 from state_machine import RallyStateMachine
 
 
-def create_state_machine_graph(sm: RallyStateMachine, filename: str = "bv_state_machine") -> None:
-    """Create a Graphviz visualization of the state machine."""
+# Edge color per action type, indexed by ActionType value
+EDGE_COLORS = ('blue', 'green', 'orange', 'red', 'purple', 'brown', 'gray')
+
+
+# Node fill colors for the serving team, the receiving team and terminal states
+SERVING_COLOR = '#E3F2FD'  # Light blue
+RECEIVING_COLOR = '#E8F5E8'  # Light green
+TERMINAL_COLOR = '#FFEBEE'  # Light red
+
+# Key states included in the simplified view
+KEY_STATES = frozenset({
+    's_serve_ready', 's_serve_ace', 's_serve_error', 's_serve_in_play',
+    'r_reception_perfect', 'r_reception_good', 'r_reception_error',
+    'r_set_perfect', 'r_set_good', 'r_set_error',
+    'r_attack_kill', 'r_attack_error', 'r_attack_defended',
+    's_dig_perfect', 's_dig_good', 's_dig_error',
+    's_set_perfect', 's_set_good', 's_attack_kill', 's_attack_error'
+})
+
+
+def _add_state_node(dot: graphviz.Digraph, sm: RallyStateMachine, state: str) -> None:
+    """Add a node for `state`, colored by team or as a terminal state."""
+    if sm.is_terminal_state(state):
+        dot.node(state, state, fillcolor=TERMINAL_COLOR, shape='doublecircle')
+    elif state.startswith('s_'):
+        dot.node(state, state, fillcolor=SERVING_COLOR)
+    elif state.startswith('r_'):
+        dot.node(state, state, fillcolor=RECEIVING_COLOR)
+    else:
+        dot.node(state, state)
+
+
+def build_full_digraph(sm: RallyStateMachine) -> graphviz.Digraph:
+    """Build the Graphviz graph of every state and transition, in one pass over each."""
     
     dot = graphviz.Digraph(comment='Beach Volleyball State Machine')
     dot.attr(rankdir='TB', size='20,20')
     dot.attr('node', shape='box', style='rounded,filled')
     
-    # Color scheme for different teams and states
-    serving_color = '#E3F2FD'  # Light blue
-    receiving_color = '#E8F5E8'  # Light green
-    terminal_color = '#FFEBEE'  # Light red
-    
     # Add nodes
-    for state in sm.get_all_states():
-        if sm.is_terminal_state(state):
-            dot.node(state, state, fillcolor=terminal_color, shape='doublecircle')
-        elif state.startswith('s_'):
-            dot.node(state, state, fillcolor=serving_color)
-        elif state.startswith('r_'):
-            dot.node(state, state, fillcolor=receiving_color)
-        else:
-            dot.node(state, state)
+    for state in sorted(sm.get_all_states()):
+        _add_state_node(dot, sm, state)
     
-    # Add edges with probabilities
+    # Add edges with probabilities, colored by action type
     for state, transitions in sm.transitions.items():
         for next_state, probability, action_type in transitions:
-            # Format probability as percentage
-            prob_str = f"{float(probability):.1%}"
-            label = f"{prob_str}\\n{action_type.value}"
-            
-            # Color edges by action type
-            edge_colors = {
-                'serve': 'blue',
-                'reception': 'green',
-                'set': 'orange',
-                'attack': 'red',
-                'dig': 'purple',
-                'block': 'brown',
-                'transition': 'gray'
-            }
-            color = edge_colors.get(action_type.value, 'black')
-            
-            dot.edge(state, next_state, label=label, color=color)
-    
-    # Render the graph
-    dot.render(filename, format='png', cleanup=True)
-    dot.render(filename, format='svg', cleanup=True)
-    print(f"State machine graph saved as {filename}.png and {filename}.svg")
+            label = f"{probability:.1%}\\n{action_type.name.lower()}"
+            dot.edge(state, next_state, label=label, color=EDGE_COLORS[action_type])
+    
+    return dot
 
 
-def create_simplified_graph(sm: RallyStateMachine, filename: str = "bv_state_machine_simple") -> None:
-    """Create a simplified visualization showing only main flow."""
-    
-    # Key states to include in simplified view
-    key_states = {
-        's_serve_ready', 's_serve_ace', 's_serve_error', 's_serve_in_play',
-        'r_reception_perfect', 'r_reception_good', 'r_reception_error',
-        'r_set_perfect', 'r_set_good', 'r_set_error',
-        'r_attack_kill', 'r_attack_error', 'r_attack_defended',
-        's_dig_perfect', 's_dig_good', 's_dig_error',
-        's_set_perfect', 's_set_good', 's_attack_kill', 's_attack_error'
-    }
+def build_simplified_digraph(sm: RallyStateMachine) -> graphviz.Digraph:
+    """Build the Graphviz graph of the main flow, restricted to KEY_STATES."""
     
     dot = graphviz.Digraph(comment='Beach Volleyball State Machine (Simplified)')
     dot.attr(rankdir='TB', size='16,12')
     dot.attr('node', shape='box', style='rounded,filled')
     
+    key_states = sorted(KEY_STATES & sm.get_all_states())
+    
     # Add only key nodes
     for state in key_states:
-        if state in sm.get_all_states():
-            if sm.is_terminal_state(state):
-                dot.node(state, state, fillcolor='#FFEBEE', shape='doublecircle')
-            elif state.startswith('s_'):
-                dot.node(state, state, fillcolor='#E3F2FD')
-            elif state.startswith('r_'):
-                dot.node(state, state, fillcolor='#E8F5E8')
+        _add_state_node(dot, sm, state)
     
     # Add edges between key states only
     for state in key_states:
-        if state in sm.transitions:
-            for next_state, probability, action_type in sm.transitions[state]:
-                if next_state in key_states:
-                    prob_str = f"{float(probability):.1%}"
-                    dot.edge(state, next_state, label=prob_str)
+        for next_state, probability, _ in sm.transitions.get(state, ()):
+            if next_state in KEY_STATES:
+                dot.edge(state, next_state, label=f"{probability:.1%}")
     
-    dot.render(filename, format='png', cleanup=True)
-    print(f"Simplified state machine graph saved as {filename}.png")
+    return dot
+
+
+def render_digraph(dot: graphviz.Digraph, filename: str, formats: Sequence[str], description: str) -> None:
+    """Render one built graph to `filename` in each of `formats`, without rebuilding it."""
+    for fmt in formats:
+        dot.render(filename, format=fmt, cleanup=True)
+    print(f"{description} saved as " + " and ".join(f"{filename}.{fmt}" for fmt in formats))
+
+
+def create_state_machine_graph(sm: RallyStateMachine, filename: str = "bv_state_machine") -> None:
+    """Create a Graphviz visualization of the state machine (PNG and SVG)."""
+    render_digraph(build_full_digraph(sm), filename, ('png', 'svg'), "State machine graph")
+
+
+def create_simplified_graph(sm: RallyStateMachine, filename: str = "bv_state_machine_simple") -> None:
+    """Create a simplified visualization showing only main flow (PNG)."""
+    render_digraph(build_simplified_digraph(sm), filename, ('png',), "Simplified state machine graph")
 
 
 def analyze_probabilities(sm: RallyStateMachine) -> None:
@@ -112,14 +115,14 @@ def analyze_probabilities(sm: RallyStateMachine) -> None:
     serve_transitions = sm.get_next_states('s_serve_ready')
     print("Serve outcomes:")
     for next_state, prob, _ in serve_transitions:
-        print(f"  {next_state}: {float(prob):.1%}")
+        print(f"  {next_state}: {prob:.1%}")
     
     # Analyze reception quality distribution
     if 's_serve_in_play' in sm.transitions:
         reception_transitions = sm.get_next_states('s_serve_in_play')
         print("\nReception quality from serve:")
         for next_state, prob, _ in reception_transitions:
-            print(f"  {next_state}: {float(prob):.1%}")
+            print(f"  {next_state}: {prob:.1%}")
     
     # Analyze attack success from perfect sets
     perfect_set_states = ['r_set_perfect', 's_set_perfect']
@@ -128,14 +131,13 @@ def analyze_probabilities(sm: RallyStateMachine) -> None:
             attack_transitions = sm.get_next_states(set_state)
             print(f"\nAttack outcomes from {set_state}:")
             for next_state, prob, _ in attack_transitions:
-                print(f"  {next_state}: {float(prob):.1%}")
+                print(f"  {next_state}: {prob:.1%}")
     
     # Count terminal states by winner
     serving_wins = 0
     receiving_wins = 0
     for terminal_state in sm.terminal_states:
-        from state_definitions import get_winning_team
-        winner = get_winning_team(terminal_state)
+        winner = WINNER_OF[terminal_state]
         if winner == 'serving':
             serving_wins += 1
         else:
@@ -169,9 +171,9 @@ def create_probability_heatmap() -> None:
                 for next_state, prob, _ in state_transitions:
                     if next_state in to_states:
                         # Create visual bar
-                        bar_length = int(float(prob) * 20)  # Scale to 20 chars
+                        bar_length = int(prob * 20)  # Scale to 20 chars
                         bar = "█" * bar_length + "░" * (20 - bar_length)
-                        print(f"  {next_state:20} {bar} {float(prob):6.1%}")
+                        print(f"  {next_state:20} {bar} {prob:6.1%}")
 
 
 if __name__ == "__main__":